@@ -0,0 +1,98 @@
+import numpy as np
+
+'''
+Running sum of repeated scans
+
+The first finished scan fixes a common x grid.  Every later scan is
+linearly interpolated onto that grid for all detectors at once (one set of
+interpolation weights, applied to a channels x points block) and added to
+the running sums.  Memory holds one sum and one contribution count per
+channel, whatever the number of repeats.  Results are scaled to the full
+number of scans at every grid point, so edges and ranges that fewer scans
+covered do not dip, and the scan in progress can be included without being
+stored.
+'''
+
+
+def interpolation_weights(x_values, grid):
+    """Return (lower index, upper weight, inside mask) to resample x_values onto grid."""
+    upper = np.clip(np.searchsorted(x_values, grid), 1, x_values.size - 1)
+    lower = upper - 1
+    span = x_values[upper] - x_values[lower]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        weight = np.where(span > 0, (grid - x_values[lower]) / span, 0.0)
+    inside = (grid >= x_values[0]) & (grid <= x_values[-1])
+    return lower, weight, inside
+
+
+class ScanAccumulator:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.grid = None
+        self.keys = []
+        self.sums = None
+        self.contributions = None
+        self.num_scans = 0
+
+    def add(self, x_values, detectors_arrays):
+        x_values = np.asarray(x_values, dtype=np.float64)
+        if x_values.size < 2:
+            return
+        if self.grid is None:
+            self.grid = np.sort(x_values, kind='stable')
+        keys = [key for key in detectors_arrays]
+        for key in keys:
+            if key not in self.keys:
+                # a channel first seen now starts from zero
+                self.keys.append(key)
+                block = np.zeros((1, self.grid.size))
+                self.sums = block if self.sums is None else np.vstack([self.sums, block])
+                self.contributions = block.copy() if self.contributions is None \
+                    else np.vstack([self.contributions, block])
+        rows = [self.keys.index(key) for key in keys]
+        resampled, valid = self.resample(x_values, [detectors_arrays[key] for key in keys])
+        self.sums[rows] += resampled
+        self.contributions[rows] += valid
+        self.num_scans += 1
+
+    def resample(self, x_values, y_arrays):
+        """Return (values, valid) of one scan on the grid, channels x grid points, 0 where not valid."""
+        x_values = np.asarray(x_values, dtype=np.float64)
+        order = np.argsort(x_values, kind='stable')
+        values = np.vstack([np.asarray(y_values, dtype=np.float64)[order] for y_values in y_arrays])
+        lower, weight, inside = interpolation_weights(x_values[order], self.grid)
+        resampled = values[:, lower] * (1.0 - weight) + values[:, lower + 1] * weight
+        valid = inside & np.isfinite(resampled)
+        return np.where(valid, resampled, 0.0), valid
+
+    def result(self, key, live=None):
+        """Return (grid, sum, counting error) for one channel, or None.
+
+        live is an optional (x, y) pair of the scan in progress, included
+        but not stored.  Each grid point is scaled from the scans that
+        covered it to the full count.
+        """
+        if self.grid is None:
+            if live is None or len(live[0]) < 2:
+                return None
+            # nothing summed yet: the scan in progress is the whole result
+            order = np.argsort(live[0], kind='stable')
+            total = np.asarray(live[1], dtype=np.float64)[order]
+            return np.asarray(live[0], dtype=np.float64)[order], total, np.sqrt(np.abs(total))
+        if key in self.keys:
+            row = self.keys.index(key)
+            sums, counts = self.sums[row], self.contributions[row]
+        else:
+            sums, counts = np.zeros(self.grid.size), np.zeros(self.grid.size)
+        if live is not None and len(live[0]) > 1:
+            resampled, valid = self.resample(live[0], [live[1]])
+            sums, counts = sums + resampled[0], counts + valid[0]
+        measured = counts > 0
+        if not measured.any():
+            return None
+        scale = counts.max() / counts[measured]
+        total = sums[measured]
+        # Poisson counting error of the summed counts, scaled like the sum
+        return self.grid[measured], total * scale, np.sqrt(np.abs(total)) * scale
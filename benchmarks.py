@@ -0,0 +1,253 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+from kernels import derivative, crossings, RunningBounds
+from mda_cache import parse_mda, load_archived_scan
+
+'''
+Correctness checks and micro-benchmarks for the numeric kernels and MDA I/O
+
+Every kernel is first compared with a plain reference implementation (the
+loops the GUI used before the kernels were vectorised), then timed on
+synthetic scans of 10^2 to 10^6 points.  MDA loading is timed on recorded
+files given with --mda, both as a full readMDA parse and as a cached
+memory-mapped load.
+
+    python benchmarks.py --save-baseline      record timings on this machine
+    python benchmarks.py                      compare against the baseline
+    python benchmarks.py --require-baseline   same, but a missing baseline fails (CI)
+    python benchmarks.py --mda scan_0001.mda  include MDA loading
+
+Timings are stored as multiples of a reference loop (chunked numpy
+reductions over the same number of points) timed alongside each run, so a
+baseline recorded on one machine still holds on a faster or slower one.
+The exit status is 1 if a check fails or a kernel is slower than its baseline
+by more than the tolerance, so the script can gate a commit or a CI job.
+benchmark_baseline.json in the repository holds the reference timings;
+re-record it with --save-baseline when a kernel is deliberately changed.
+'''
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+SIZES = (10 ** 2, 10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6)
+TOLERANCE = 0.25
+REPEATS = 7
+# slowdown (seconds) below which a ratio over the tolerance is put down to noise,
+# raised to a fraction of the reference loop for the larger sizes
+NOISE_FLOOR = 50e-6
+NOISE_FRACTION = 0.1
+CHECK_SIZES = (2, 3, 10, 1000)
+
+
+def synthetic_scan(num_points, seed=0):
+    # a peak on a noisy background over a monotonic positioner, as in a typical alignment scan
+    rng = np.random.default_rng(seed)
+    x_values = np.linspace(-1.0, 1.0, num_points)
+    y_values = 1000.0 * np.exp(-x_values ** 2 / 0.02) + rng.normal(50.0, 5.0, num_points)
+    return x_values, y_values
+
+
+def reference_derivative(x_values, y_values):
+    x_length = len(x_values)
+    y_temp = np.zeros(len(y_values))
+    for x in range(1, x_length - 1):
+        dy = y_values[x + 1] - y_values[x - 1]
+        dx = x_values[x + 1] - x_values[x - 1]
+        y_temp[x] = dy / dx
+    y_temp[0] = y_temp[1]
+    y_temp[-1] = y_temp[-2]
+    return y_temp
+
+
+def reference_crossings(x_points, y_points, level):
+    x_crossing_points = []
+    for i in range(x_points.size - 1):
+        if y_points[i] < level <= y_points[i + 1] or y_points[i + 1] < level <= y_points[i]:
+            y2, y1, x2, x1 = y_points[i + 1], y_points[i], x_points[i + 1], x_points[i]
+            m = (y2 - y1) / (x2 - x1)
+            x_crossing_points.append((level - y1) / m + x1)
+    return np.array(x_crossing_points)
+
+
+def incremental_bounds(arrays, num_points, step):
+    # feed the points in the way a running scan delivers them
+    bounds = RunningBounds()
+    for n in range(step, num_points + step, step):
+        bounds.update(arrays, min(n, num_points))
+    return bounds
+
+
+def run_checks():
+    failures = []
+
+    def check(name, passed):
+        print(f'  {"ok  " if passed else "FAIL"} {name}')
+        if not passed:
+            failures.append(name)
+
+    print('correctness')
+    for num_points in CHECK_SIZES:
+        x_values, y_values = synthetic_scan(num_points)
+        check(f'derivative, {num_points} points',
+              np.allclose(derivative(x_values, y_values), reference_derivative(x_values, y_values)))
+        level = (y_values.min() + y_values.max()) / 2.0
+        found, expected = crossings(x_values, y_values, level), reference_crossings(x_values, y_values, level)
+        check(f'crossings, {num_points} points', found.shape == expected.shape and np.allclose(found, expected))
+    # integer detector data and a flat region exactly at the level
+    x_values = np.arange(8, dtype=float)
+    y_values = np.array([0, 5, 5, 10, 10, 5, 5, 0])
+    check('crossings, integer data touching the level',
+          np.allclose(crossings(x_values, y_values, 5.0), reference_crossings(x_values, y_values, 5.0)))
+    arrays = {'D01CV': synthetic_scan(1000)[1], 'D02CV': np.full(1000, np.nan)}
+    arrays['D02CV'][300:400] = -1.0
+    bounds = incremental_bounds(arrays, 1000, 7)
+    check('running bounds match a full pass',
+          bounds.combined(['D01CV', 'D02CV']) == (-1.0, arrays['D01CV'].max()))
+    bounds.update(arrays, 10)
+    check('running bounds restart on a new scan',
+          bounds.combined(['D01CV']) == (arrays['D01CV'][:10].min(), arrays['D01CV'][:10].max()))
+    return failures
+
+
+def reference_loop(x_values, y_values):
+    # interpreter overhead and memory traffic in about the proportions of the kernels
+    total = 0.0
+    for chunk in np.array_split(x_values * y_values, 100):
+        if chunk.size:
+            total += np.fmax.reduce(chunk) - np.fmin.reduce(chunk)
+    return total
+
+
+def elapsed(function, *args):
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def relative_time(reference_args, function, *args):
+    # each run is paired with a reference loop right next to it, so a machine that
+    # slows down for a while slows both; returns the best time and the median ratio
+    function(*args)
+    reference_loop(*reference_args)
+    times, ratios = [], []
+    for _ in range(REPEATS):
+        reference = elapsed(reference_loop, *reference_args)
+        seconds = elapsed(function, *args)
+        times.append(seconds)
+        ratios.append(seconds / reference)
+    return min(times), float(np.median(ratios))
+
+
+def problem_size(name):
+    # kernel entries end in their number of points; MDA loads count as the largest size
+    size = name.rsplit('/', 1)[-1]
+    return int(size) if size.isdigit() else max(SIZES)
+
+
+def size_tolerance(name, tolerance):
+    # short runs jitter more, so the allowed slowdown grows as the size falls
+    return tolerance * (1.0 + np.log10(max(SIZES) / problem_size(name)) / 2.0)
+
+
+def run_kernel_benchmarks():
+    results = {}
+    for num_points in SIZES:
+        x_values, y_values = synthetic_scan(num_points)
+        level = (y_values.min() + y_values.max()) / 2.0
+        arrays = {'D%2.2iCV' % n: y_values for n in range(1, 11)}
+        reference_args = (x_values, y_values)
+        results[f'derivative/{num_points}'] = relative_time(reference_args, derivative, x_values, y_values)
+        results[f'crossings/{num_points}'] = relative_time(reference_args, crossings, x_values, y_values, level)
+        # ten detectors, one update per 1 % of the scan
+        results[f'bounds/{num_points}'] = relative_time(reference_args, incremental_bounds,
+                                                        arrays, num_points, max(num_points // 100, 1))
+    return results
+
+
+def run_mda_benchmarks(fnames):
+    results = {}
+    cache_dir = tempfile.mkdtemp(prefix='oculus3_bench_')
+    reference_args = synthetic_scan(max(SIZES))
+    try:
+        for fname in fnames:
+            tail = os.path.basename(fname)
+            results[f'readMDA/{tail}'] = relative_time(reference_args, parse_mda, fname)
+            # the first call fills the cache, the timed calls are memory-mapped loads
+            results[f'cached/{tail}'] = relative_time(reference_args, load_archived_scan, fname, cache_dir)
+    except ImportError:
+        print('mda is not installed, skipping MDA loading')
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    # results hold (seconds, ratio to the reference loop) and the baseline holds ratios;
+    # a slowdown only counts if it is also larger than timer noise
+    regressions = []
+    print('timings')
+    for name, (seconds, ratio) in results.items():
+        line = f'  {name:<28} {seconds * 1e3:10.3f} ms'
+        if name in baseline:
+            slowdown = ratio / baseline[name]
+            line += f'  {slowdown:5.2f}x baseline'
+            noise = max(NOISE_FLOOR, NOISE_FRACTION * seconds / ratio)
+            if slowdown > 1.0 + size_tolerance(name, tolerance) and seconds - seconds / slowdown > noise:
+                line += '  SLOWER'
+                regressions.append(name)
+        print(line)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check and time the Oculus numeric kernels and MDA loading.')
+    parser.add_argument('--mda', nargs='+', default=[], help='recorded MDA files to time')
+    parser.add_argument('--baseline', default=BASELINE_FILE)
+    parser.add_argument('--save-baseline', action='store_true', help='store these timings as the baseline')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE,
+                        help='allowed slowdown as a fraction of the baseline at 10^6 points, '
+                             'widened for smaller sizes (default 0.25)')
+    parser.add_argument('--require-baseline', action='store_true',
+                        help='fail when there is no baseline to compare with, for CI')
+    args = parser.parse_args(argv)
+
+    failures = run_checks()
+    results = run_kernel_benchmarks()
+    results.update(run_mda_benchmarks(args.mda))
+
+    baseline = {}
+    if os.path.isfile(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    elif not args.save_baseline:
+        print('no baseline at', args.baseline, '- run with --save-baseline to record one')
+        if args.require_baseline:
+            return 1
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions and not args.save_baseline:
+        # a real slowdown shows up again, a burst of load on the machine rarely does
+        print(f'{len(regressions)} slower, timing again')
+        retry = run_kernel_benchmarks()
+        retry.update(run_mda_benchmarks(args.mda))
+        results = {name: min(results[name], retry[name], key=lambda timing: timing[1]) for name in results}
+        regressions = compare(results, baseline, args.tolerance)
+
+    if args.save_baseline:
+        # keep entries for MDA files not given this time
+        baseline.update({name: ratio for name, (seconds, ratio) in results.items()})
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=1, sort_keys=True)
+        print('baseline written to', args.baseline)
+        regressions = []
+    if failures or regressions:
+        print(f'{len(failures)} failed check(s), {len(regressions)} regression(s)')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,4 +1,5 @@
 NUM_POSITIONERS = 4
 NUM_TRIGGERS = 2
 NUM_DETECTORS = 20
+NUM_VIRTUAL_DETECTORS = 10
 MAX_NUM_POINTS = 1000
\ No newline at end of file
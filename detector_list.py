@@ -0,0 +1,111 @@
+from PyQt5 import QtCore as qtc
+import constants
+
+'''
+Item model behind the detector list
+
+One row per detector and virtual channel, with three columns: the key
+('D01'), the checkable name, and the live sparkline.  A view only asks for
+the rows it shows.  Renames, check changes and new sparklines each signal
+dataChanged for the one cell they touch, so nothing else is laid out or
+repainted.
+'''
+
+KEY_COLUMN, NAME_COLUMN, SPARKLINE_COLUMN = range(3)
+
+
+def detector_keys():
+    keys = ['D%2.2iCV' % i for i in range(1, constants.NUM_DETECTORS + 1)]
+    keys += ['V%2.2iCV' % i for i in range(1, constants.NUM_VIRTUAL_DETECTORS + 1)]
+    return keys
+
+
+class DetectorListModel(qtc.QAbstractTableModel):
+    # key_cv and new state whenever a row is checked or unchecked
+    check_toggled_signal = qtc.pyqtSignal(str, bool)
+
+    def __init__(self, blank_pixmap, parent=None):
+        super().__init__(parent)
+        self.keys = detector_keys()
+        self.rows = {key: row for row, key in enumerate(self.keys)}
+        self.names = {key: '' for key in self.keys}
+        self.checked = set()
+        self.blank = blank_pixmap
+        self.pixmaps = {}
+
+    def rowCount(self, parent=qtc.QModelIndex()):
+        return 0 if parent.isValid() else len(self.keys)
+
+    def columnCount(self, parent=qtc.QModelIndex()):
+        return 0 if parent.isValid() else 3
+
+    def data(self, index, role=qtc.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        key = self.keys[index.row()]
+        column = index.column()
+        if role == qtc.Qt.DisplayRole:
+            if column == KEY_COLUMN:
+                return key[:3]
+            if column == NAME_COLUMN:
+                return self.names[key]
+        elif role == qtc.Qt.CheckStateRole and column == NAME_COLUMN:
+            return qtc.Qt.Checked if key in self.checked else qtc.Qt.Unchecked
+        elif role == qtc.Qt.DecorationRole and column == SPARKLINE_COLUMN:
+            return self.pixmaps.get(key, self.blank)
+        return None
+
+    def setData(self, index, value, role=qtc.Qt.EditRole):
+        if not index.isValid() or role != qtc.Qt.CheckStateRole or index.column() != NAME_COLUMN:
+            return False
+        self.set_checked(self.keys[index.row()], value == qtc.Qt.Checked)
+        return True
+
+    def flags(self, index):
+        flags = qtc.Qt.ItemIsEnabled | qtc.Qt.ItemIsSelectable
+        if index.column() == NAME_COLUMN:
+            flags |= qtc.Qt.ItemIsUserCheckable
+        return flags
+
+    def cell_changed(self, key, column, roles):
+        index = self.index(self.rows[key], column)
+        self.dataChanged.emit(index, index, roles)
+
+    def is_checked(self, key):
+        return key in self.checked
+
+    def checked_keys(self):
+        return [key for key in self.keys if key in self.checked]
+
+    def set_checked(self, key, checked):
+        if checked == (key in self.checked):
+            return
+        if checked:
+            self.checked.add(key)
+        else:
+            self.checked.discard(key)
+        self.cell_changed(key, NAME_COLUMN, [qtc.Qt.CheckStateRole])
+        self.check_toggled_signal.emit(key, checked)
+
+    def set_name(self, key, name):
+        if key not in self.rows or self.names[key] == name:
+            return
+        self.names[key] = name
+        self.cell_changed(key, NAME_COLUMN, [qtc.Qt.DisplayRole])
+
+    def set_names(self, names):
+        # names is keyed like the snapshot ('D01PV'); channels missing from it are blank
+        for key in self.keys:
+            self.set_name(key, names.get(key.replace('CV', 'PV'), ''))
+
+    def set_pixmap(self, key, pixmap):
+        if key not in self.rows:
+            return
+        self.pixmaps[key] = pixmap
+        self.cell_changed(key, SPARKLINE_COLUMN, [qtc.Qt.DecorationRole])
+
+    def clear_pixmaps(self):
+        keys = list(self.pixmaps)
+        self.pixmaps = {}
+        for key in keys:
+            self.cell_changed(key, SPARKLINE_COLUMN, [qtc.Qt.DecorationRole])
@@ -0,0 +1,283 @@
+import json
+import struct
+import numpy as np
+from PyQt5 import QtCore as qtc
+from PyQt5 import QtNetwork as qtn
+import constants
+from scan_core import ScanCore
+from scan_timing import TIMING_KEYS
+from virtual_channels import VirtualChannels
+
+'''
+Local fan-out of one scan record to many Oculus viewers
+
+A publishing Oculus (CoreData plus SnapshotPublisher) keeps the only set of
+CA subscriptions and re-broadcasts every snapshot over a QLocalServer.  Thin
+clients (RemoteCoreData) stand in for CoreData in the controller and never
+talk to the IOC for scan data.
+
+Each message is two uint32 lengths followed by a JSON header and a float64
+payload of shape (len(keys), stop - start).  Header types:
+    'points'  keys (positioners, detectors, then the timing columns),
+              start, stop, dtypes (when start is 0),
+              names (when changed), meta (when changed)
+    'state'   value of DATA as seen by the publisher's scan_state_signal
+A 'points' message with start == 0 tells the client to start fresh buffers.
+Points are sent from the snapshot's first_changed on, so a rewritten point
+(a repeated CPT, a backfill) reaches the clients as well as the new ones.
+'''
+
+PREFIX = struct.Struct('<II')
+
+
+def server_name(trunk):
+    return 'oculus3-' + trunk.replace(':', '_').rstrip('.')
+
+
+def encode_message(header, payload=b''):
+    text = json.dumps(header).encode()
+    return PREFIX.pack(len(text), len(payload)) + text + payload
+
+
+class SnapshotPublisher(qtc.QObject):
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+        self.server = None
+        self.clients = []
+
+        # what has already been broadcast, so each snapshot only sends new points
+        self.sent_points = 0
+        self.sent_keys = []
+        self.sent_names = None
+        self.sent_meta = None
+
+    def start(self):
+        # runs on the acquisition thread, next to the model
+        self.server = qtn.QLocalServer(self)
+        qtn.QLocalServer.removeServer(server_name(self.model.trunk))
+        if not self.server.listen(server_name(self.model.trunk)):
+            print('could not start fan-out server:', self.server.errorString())
+            return
+        self.server.newConnection.connect(self.add_client)
+        self.model.snapshot_ready_signal.connect(self.publish)
+        self.model.scan_state_signal.connect(self.publish_state)
+
+    def metadata(self):
+        # scalar values the controller reads directly from model PVs
+        meta = {'DATA': self.model.data.value, 'CPT': self.model.cpt.value, 'NPTS': self.model.npts.value,
+                'saveData_fileSystem': self.model.file_path_fs.value,
+                'saveData_subDir': self.model.file_path_sd.value,
+                'saveData_fileName': self.model.file_name_display.value}
+        for key in self.model.pnpv:
+            if not key.endswith('RA'):
+                meta[key] = self.model.pnpv[key].value
+        return meta
+
+    @staticmethod
+    def snapshot_arrays(snapshot):
+        return dict(snapshot.positioners_arrays, **snapshot.detectors_arrays, **snapshot.timing_arrays)
+
+    def points_message(self, snapshot, start, names, meta):
+        arrays = self.snapshot_arrays(snapshot)
+        keys = list(arrays)
+        block = np.zeros((len(keys), snapshot.num_points - start))
+        for row, key in enumerate(keys):
+            block[row] = arrays[key][start:snapshot.num_points]
+        header = {'type': 'points', 'keys': keys, 'start': start, 'stop': snapshot.num_points}
+        if start == 0:
+            # points travel as float64; clients keep the publisher's compact buffer types
+            header['dtypes'] = [arrays[key].dtype.str for key in keys]
+        if names is not None:
+            header['names'] = names
+        if meta is not None:
+            header['meta'] = meta
+        return encode_message(header, block.tobytes())
+
+    @staticmethod
+    def snapshot_names(snapshot):
+        return {'positioners': snapshot.positioners_names, 'detectors': snapshot.detectors_names}
+
+    def add_client(self):
+        while self.server.hasPendingConnections():
+            client = self.server.nextPendingConnection()
+            client.disconnected.connect(lambda c=client: self.remove_client(c))
+            self.clients.append(client)
+            # a new viewer gets the complete current state once
+            snapshot = self.model.latest_snapshot
+            client.write(self.points_message(snapshot, 0, self.snapshot_names(snapshot), self.metadata()))
+
+    def remove_client(self, client):
+        if client in self.clients:
+            self.clients.remove(client)
+        client.deleteLater()
+
+    def broadcast(self, message):
+        for client in self.clients:
+            client.write(message)
+
+    def publish(self, snapshot):
+        keys = list(self.snapshot_arrays(snapshot))
+        names = self.snapshot_names(snapshot)
+        meta = self.metadata()
+        # restart from zero on a new scan or when the channel layout changes
+        if snapshot.num_points < self.sent_points or keys != self.sent_keys:
+            start = 0
+        else:
+            # resend from the first rewritten point, if any was rewritten
+            start = min(self.sent_points, snapshot.first_changed)
+        if self.clients:
+            self.broadcast(self.points_message(snapshot, start,
+                                               names if names != self.sent_names else None,
+                                               meta if meta != self.sent_meta else None))
+        self.sent_points = snapshot.num_points
+        self.sent_keys = keys
+        self.sent_names = names
+        self.sent_meta = meta
+
+    def publish_state(self, value):
+        self.broadcast(encode_message({'type': 'state', 'value': value}))
+
+
+class RemoteValue:
+    # read-only stand-in for a PV, holding the publisher's last value
+    def __init__(self, value=None):
+        self.value = value
+
+    def get(self, **kwargs):
+        return self.value
+
+
+class RemoteCoreData(qtc.QObject):
+    # same public surface the controller uses on CoreData
+    snapshot_ready_signal = qtc.pyqtSignal(object)
+    scan_state_signal = qtc.pyqtSignal(int)
+    add_virtual_channel_signal = qtc.pyqtSignal(str)
+    clear_virtual_channels_signal = qtc.pyqtSignal()
+    status_signal = qtc.pyqtSignal(str)
+
+    def __init__(self, root, stump):
+        super().__init__()
+        self.root = root
+        self.stump = stump
+        self.trunk = root + stump
+
+        self.pnpv = {}
+        for i in range(1, constants.NUM_POSITIONERS + 1):
+            for a in ScanCore.pos_attrs:
+                self.pnpv['P%i%s' % (i, a)] = RemoteValue()
+        self.data = RemoteValue(1)
+        self.cpt = RemoteValue(0)
+        self.npts = RemoteValue(0)
+        self.file_path_fs = RemoteValue('')
+        self.file_path_sd = RemoteValue('')
+        self.file_name_display = RemoteValue('')
+        self.meta_values = {'DATA': self.data, 'CPT': self.cpt, 'NPTS': self.npts,
+                            'saveData_fileSystem': self.file_path_fs,
+                            'saveData_subDir': self.file_path_sd,
+                            'saveData_fileName': self.file_name_display}
+        self.meta_values.update(self.pnpv)
+
+        self.active_positioners_arrays = {}
+        self.active_positioners_names = {}
+        self.active_detectors_arrays = {}
+        self.active_detectors_names = {}
+        # the publisher's timing columns arrive with the points
+        self.timing_arrays = {}
+        # detector PVs are not monitored over the link, so nothing can sample them live
+        self.dnncv = {}
+        # virtual channels are evaluated by the publisher and arrive as detectors, so this stays empty
+        self.virtual_channels = VirtualChannels()
+
+        self.positioners_modified_flag = True
+        self.detectors_modified_flag = True
+
+        self.num_points = 0
+        self.snapshot_version = 0
+        self.latest_snapshot = None
+        self.published_points = 0
+        self.first_changed = 0
+        self.publish_snapshot()
+
+        self.socket = None
+        self.buffer = b''
+
+        self.add_virtual_channel_signal.connect(self.ignore_virtual_channels)
+        self.clear_virtual_channels_signal.connect(self.ignore_virtual_channels)
+
+    def ignore_virtual_channels(self, *args):
+        # virtual channels are evaluated by the publisher and arrive as detectors
+        print('virtual channels are defined on the publishing Oculus')
+
+    # snapshots are built exactly as on the publisher
+    publish_snapshot = ScanCore.publish_snapshot
+    detach_buffers = ScanCore.detach_buffers
+
+    def snapshot_ready(self, snapshot):
+        self.snapshot_ready_signal.emit(snapshot)
+
+    def report_status(self, message):
+        print(message)
+        self.status_signal.emit(message)
+
+    def buffers_for(self, key):
+        if key in TIMING_KEYS:
+            return self.timing_arrays
+        return self.active_positioners_arrays if key.startswith('R') else self.active_detectors_arrays
+
+    def start_acquisition(self):
+        self.socket = qtn.QLocalSocket(self)
+        self.socket.readyRead.connect(self.read_messages)
+        self.socket.disconnected.connect(lambda: self.report_status('lost connection to the publishing Oculus'))
+        self.socket.connectToServer(server_name(self.trunk))
+        if not self.socket.waitForConnected(1000):
+            self.report_status('could not connect to the publishing Oculus: ' + self.socket.errorString())
+
+    def read_messages(self):
+        self.buffer += bytes(self.socket.readAll())
+        while len(self.buffer) >= PREFIX.size:
+            header_length, payload_length = PREFIX.unpack_from(self.buffer)
+            end = PREFIX.size + header_length + payload_length
+            if len(self.buffer) < end:
+                return
+            header = json.loads(self.buffer[PREFIX.size:PREFIX.size + header_length].decode())
+            payload = self.buffer[PREFIX.size + header_length:end]
+            self.buffer = self.buffer[end:]
+            if header['type'] == 'points':
+                self.apply_points(header, payload)
+            elif header['type'] == 'state':
+                self.scan_state_signal.emit(header['value'])
+
+    def apply_points(self, header, payload):
+        for key, value in header.get('meta', {}).items():
+            if key in self.meta_values:
+                self.meta_values[key].value = value
+        if 'names' in header:
+            if header['names']['positioners'] != self.active_positioners_names:
+                self.positioners_modified_flag = True
+            if header['names']['detectors'] != self.active_detectors_names:
+                self.detectors_modified_flag = True
+            self.active_positioners_names = header['names']['positioners']
+            self.active_detectors_names = header['names']['detectors']
+        start, stop, keys = header['start'], header['stop'], header['keys']
+        if start == 0:
+            # a new scan gets new arrays; the client's earlier snapshots keep theirs
+            self.active_positioners_arrays = {}
+            self.active_detectors_arrays = {}
+            self.timing_arrays = {}
+            self.first_changed = 0
+            for key, dtype in zip(keys, header.get('dtypes', ['<f8'] * len(keys))):
+                fill = np.nan if key in TIMING_KEYS else 0
+                self.buffers_for(key)[key] = np.full(constants.MAX_NUM_POINTS, fill, np.dtype(dtype))
+        else:
+            self.detach_buffers(start)
+        block = np.frombuffer(payload).reshape(len(keys), stop - start)
+        for row, key in enumerate(keys):
+            arrays = self.buffers_for(key)
+            if key in arrays:
+                arrays[key][start:stop] = block[row]
+        self.num_points = stop
+        # the controller reads the readback arrays to size the plot after a scan
+        for key in self.active_positioners_arrays:
+            self.pnpv['P%sRA' % key[1]].value = self.active_positioners_arrays[key]
+        self.publish_snapshot()
@@ -0,0 +1,178 @@
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from PyQt5 import QtCore as qtc
+
+'''
+Live peak and edge fitting
+
+Every model takes params (amplitude, center, width, offset).  Fits use a
+small Levenberg-Marquardt loop in numpy with a fixed iteration cap, so the
+cost of one fit is bounded by the number of points, not by convergence.
+'''
+
+MAX_ITERATIONS = 20
+MAX_WORKERS = 4
+
+
+def erf(x):
+    # Abramowitz and Stegun 7.1.26, |error| < 1.5e-7, avoids a scipy dependency
+    sign = np.sign(x)
+    x = np.abs(x)
+    t = 1.0 / (1.0 + 0.3275911 * x)
+    poly = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    return sign * (1.0 - poly * np.exp(-x * x))
+
+
+def gaussian(x, a, x0, w, c):
+    return a * np.exp(-0.5 * ((x - x0) / w) ** 2) + c
+
+
+def lorentzian(x, a, x0, w, c):
+    return a / (1.0 + ((x - x0) / w) ** 2) + c
+
+
+def edge(x, a, x0, w, c):
+    return 0.5 * a * (1.0 + erf((x - x0) / (np.sqrt(2.0) * w))) + c
+
+
+FIT_MODELS = {'Gaussian': gaussian, 'Lorentzian': lorentzian, 'Edge': edge}
+
+
+def initial_guess(model, x, y):
+    if model is edge:
+        slope = np.gradient(y, x)
+        i = np.argmax(np.abs(slope))
+        return np.array([y[-1] - y[0], x[i], (x.max() - x.min()) / 10.0, y[0]])
+    c = y.min()
+    i = np.argmax(y)
+    half = y > c + 0.5 * (y[i] - c)
+    fwhm = np.ptp(x[half]) if half.sum() > 1 else (x.max() - x.min()) / 10.0
+    return np.array([y[i] - c, x[i], max(fwhm / 2.355, 1e-12), c])
+
+
+def plausible(params, x):
+    # center inside the data and width no larger than the scan span
+    return x.min() <= params[1] <= x.max() and 0 < abs(params[2]) <= np.ptp(x)
+
+
+def refine(model, x, y, p):
+    """Levenberg-Marquardt from p; return (params, residual cost) or None."""
+    damping = 1e-3
+    residual = y - model(x, *p)
+    cost = residual @ residual
+    for _ in range(MAX_ITERATIONS):
+        # forward-difference Jacobian, one extra model evaluation per parameter
+        jacobian = np.empty((x.size, p.size))
+        for k in range(p.size):
+            step = 1e-6 * max(abs(p[k]), 1e-6)
+            shifted = p.copy()
+            shifted[k] += step
+            jacobian[:, k] = (model(x, *shifted) - model(x, *p)) / step
+        jtj = jacobian.T @ jacobian
+        try:
+            delta = np.linalg.solve(jtj + damping * np.diag(np.diag(jtj) + 1e-12), jacobian.T @ residual)
+        except np.linalg.LinAlgError:
+            return None
+        trial = p + delta
+        trial_residual = y - model(x, *trial)
+        trial_cost = trial_residual @ trial_residual
+        if trial_cost < cost:
+            converged = cost - trial_cost < 1e-10 * cost
+            p, residual, cost = trial, trial_residual, trial_cost
+            damping /= 10.0
+            if converged:
+                break
+        else:
+            damping *= 10.0
+    if not (np.all(np.isfinite(p)) and np.isfinite(cost)):
+        return None
+    p[2] = abs(p[2])
+    return p, cost
+
+
+def fit_curve(model, x, y, p0=None):
+    """Return (params, residual rms) for model fitted to x, y; None if it failed.
+
+    A fit from initial_guess always runs; p0, the previous result, is tried
+    as well and kept only if it ends with the lower cost, so one bad early
+    fit cannot seed every later one.  A result whose center is outside the
+    data or whose width exceeds the scan is rejected, since the center may
+    be sent to the positioner.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if x.size < 5 or np.ptp(x) == 0:
+        return None
+    results = [refine(model, x, y, initial_guess(model, x, y))]
+    if p0 is not None and plausible(p0, x):
+        results.append(refine(model, x, y, np.array(p0, dtype=float)))
+    results = [result for result in results if result is not None and plausible(result[0], x)]
+    if not results:
+        return None
+    p, cost = min(results, key=lambda result: result[1])
+    return p, np.sqrt(cost / x.size)
+
+
+class FitEngine(qtc.QObject):
+    # key_cv, model name, params (or None) and the number of points fitted
+    fit_ready_signal = qtc.pyqtSignal(str, str, object, int)
+
+    def __init__(self):
+        super().__init__()
+        self.pool = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+        self.model_name = None
+        # last good params per detector, used to warm-start the next fit
+        self.previous = {}
+        # at most one fit in flight per detector; newer data waits for the next snapshot
+        self.pending = set()
+        # previous and pending are shared with the pool threads
+        self.lock = threading.Lock()
+        # bumped on reset, so fits started before it do not warm-start the ones after
+        self.generation = 0
+
+    def set_model(self, name):
+        with self.lock:
+            self.model_name = name if name in FIT_MODELS else None
+            self.previous = {}
+            self.generation += 1
+
+    def reset(self):
+        with self.lock:
+            self.previous = {}
+            self.generation += 1
+
+    def submit(self, x_values, detectors_arrays, keys):
+        if self.model_name is None:
+            return
+        for key in keys:
+            if key not in detectors_arrays:
+                continue
+            with self.lock:
+                if key in self.pending:
+                    continue
+                self.pending.add(key)
+                start = self.previous.get(key)
+                generation = self.generation
+            # snapshot arrays are read-only and never rewritten, so no copy is needed
+            self.pool.submit(self.run_fit, self.model_name, generation, key, x_values,
+                             detectors_arrays[key], start)
+
+    def run_fit(self, model_name, generation, key, x_values, y_values, start):
+        try:
+            result = fit_curve(FIT_MODELS[model_name], x_values, y_values, start)
+            params = None if result is None else result[0]
+            with self.lock:
+                if generation == self.generation:
+                    if params is None:
+                        # nothing usable to warm-start from next time
+                        self.previous.pop(key, None)
+                    else:
+                        self.previous[key] = params
+            self.fit_ready_signal.emit(key, model_name, params, len(x_values))
+        finally:
+            with self.lock:
+                self.pending.discard(key)
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False)
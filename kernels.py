@@ -0,0 +1,68 @@
+import numpy as np
+
+'''
+Numeric kernels on the live plotting path
+
+Kept free of Qt so they can be checked and timed on their own (see
+benchmarks.py).
+'''
+
+
+def derivative(x_values, y_values):
+    # central differences, with each end copied from its neighbour
+    # compact integer buffers are widened, so differences neither wrap nor truncate
+    x_values = np.asarray(x_values, dtype=np.float64)
+    y_values = np.asarray(y_values, dtype=np.float64)
+    y_temp = np.zeros(len(y_values))
+    if len(y_values) < 2:
+        return y_temp
+    with np.errstate(divide='ignore', invalid='ignore'):
+        y_temp[1:-1] = (y_values[2:] - y_values[:-2]) / (x_values[2:] - x_values[:-2])
+    y_temp[0] = y_temp[1]
+    y_temp[-1] = y_temp[-2]
+    return y_temp
+
+
+def crossings(x_values, y_values, level):
+    # x of every segment where the curve passes through level, by linear interpolation
+    x_values = np.asarray(x_values, dtype=np.float64)
+    y_values = np.asarray(y_values, dtype=np.float64)
+    y1, y2 = y_values[:-1], y_values[1:]
+    x1, x2 = x_values[:-1], x_values[1:]
+    crossing = ((y1 < level) & (level <= y2)) | ((y2 < level) & (level <= y1))
+    y1, y2, x1, x2 = y1[crossing], y2[crossing], x1[crossing], x2[crossing]
+    m = (y2 - y1) / (x2 - x1)
+    return (level - y1) / m + x1
+
+
+class RunningBounds:
+    # running min/max per channel, updated only from the points added since the last call
+    def __init__(self):
+        self.counted = 0
+        self.bounds = {}
+
+    def reset(self):
+        self.counted = 0
+        self.bounds = {}
+
+    def update(self, arrays, num_points):
+        if num_points < self.counted:
+            self.reset()
+        start = self.counted
+        for key, array in arrays.items():
+            # a channel added mid-scan is measured once over everything it has
+            new = array[:num_points] if key not in self.bounds else array[start:num_points]
+            if new.size == 0:
+                continue
+            # fmin/fmax skip NaN (e.g. virtual channels) without warnings
+            lo, hi = np.fmin.reduce(new), np.fmax.reduce(new)
+            if key in self.bounds:
+                lo, hi = np.fmin(lo, self.bounds[key][0]), np.fmax(hi, self.bounds[key][1])
+            self.bounds[key] = (lo, hi)
+        self.counted = num_points
+
+    def combined(self, keys):
+        found = [self.bounds[key] for key in keys if key in self.bounds and not np.isnan(self.bounds[key][0])]
+        if not found:
+            return None
+        return min(lo for lo, hi in found), max(hi for lo, hi in found)
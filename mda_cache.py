@@ -0,0 +1,93 @@
+import os
+import json
+import hashlib
+import numpy as np
+
+'''
+Binary cache for archived 1D MDA scans
+
+The first time a file is requested it is parsed with mda.readMDA and every
+positioner and detector array is written to a single 2D .npy file (one row
+per channel) next to a small .json index.  Later requests, including those
+from a new Oculus session, memory-map the .npy file instead of re-parsing.
+'''
+
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.oculus3', 'mda_cache')
+
+
+class ArchivedScan:
+    def __init__(self, fname, keys, names, num_points, table):
+        self.fname = fname
+        self.tail = os.path.basename(fname)
+        self.num_points = num_points
+        # keys follow the live naming ('R1CV', 'D01CV'), names are for display
+        self.names = names
+        self.arrays = {}
+        for row, key in enumerate(keys):
+            self.arrays[key] = table[row, :num_points]
+
+    def positioner(self, n):
+        # fall back to the first recorded positioner, then to the point index
+        if f'R{n}CV' in self.arrays:
+            return self.arrays[f'R{n}CV']
+        for key in self.arrays:
+            if key.startswith('R'):
+                return self.arrays[key]
+        return np.arange(self.num_points, dtype=float)
+
+
+def cache_key(fname):
+    # a new mtime or size invalidates the cache entry for the file
+    stat = os.stat(fname)
+    token = f'{os.path.abspath(fname)}|{stat.st_mtime_ns}|{stat.st_size}'
+    return hashlib.sha1(token.encode()).hexdigest()
+
+
+def parse_mda(fname):
+    # mda is only needed on a cache miss
+    import mda
+    dim = mda.readMDA(fname=fname, showHelp=0, verbose=0)
+    scan = dim[1]
+    num_points = scan.curr_pt
+    keys, names, rows = [], {}, []
+    for p in scan.p:
+        key = f'R{p.number + 1}CV'
+        keys.append(key)
+        names[key] = p.name
+        rows.append(p.data)
+    for d in scan.d:
+        # new-style MDA files number detectors from 0, i.e. D01 is number 0
+        key = 'D%2.2iCV' % (d.number + 1)
+        keys.append(key)
+        names[key] = d.name
+        rows.append(d.data)
+    table = np.zeros((len(rows), scan.npts))
+    for row, values in enumerate(rows):
+        table[row, :len(values)] = values
+    return keys, names, num_points, table
+
+
+def load_archived_scan(fname, cache_dir=CACHE_DIR):
+    key = cache_key(fname)
+    npy_path = os.path.join(cache_dir, key + '.npy')
+    json_path = os.path.join(cache_dir, key + '.json')
+    if os.path.isfile(npy_path) and os.path.isfile(json_path):
+        with open(json_path) as f:
+            index = json.load(f)
+        table = np.load(npy_path, mmap_mode='r')
+        return ArchivedScan(fname, index['keys'], index['names'], index['num_points'], table)
+    keys, names, num_points, table = parse_mda(fname)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # write to temporary names first so a partial entry is never picked up
+        np.save(npy_path + '.tmp.npy', table)
+        os.replace(npy_path + '.tmp.npy', npy_path)
+        with open(json_path + '.tmp', 'w') as f:
+            json.dump({'fname': os.path.abspath(fname), 'keys': keys, 'names': names,
+                       'num_points': num_points}, f)
+        os.replace(json_path + '.tmp', json_path)
+    except OSError:
+        print('could not write mda cache for', fname)
+        return ArchivedScan(fname, keys, names, num_points, table)
+    table = np.load(npy_path, mmap_mode='r')
+    return ArchivedScan(fname, keys, names, num_points, table)
@@ -1,65 +1,235 @@
+import time
+STARTUP_T0 = time.perf_counter()
+
 import sys
 from PyQt5 import QtWidgets as qtw
 from PyQt5 import QtCore as qtc
 from PyQt5 import QtGui as qtg
 import pyqtgraph as pg
 import numpy as np
-from epics import PV, caget, caput
-from epics.devices import Scan
-import time
 import os
 import constants
-from oculus3_v0_core import CoreData
+from concurrent.futures import ThreadPoolExecutor
 from oculus3_v0_view import PyQtView
-import mda
+from fitting import FitEngine, FIT_MODELS
+from sparklines import SPARKLINE_INTERVAL
+from scan_export import ScanExporter
+from profiler import SamplingProfiler
+from scan_timing import timing_series, eta_seconds, format_eta
+from accumulate import ScanAccumulator
+from kernels import RunningBounds, derivative as central_derivative
+from ring_buffer import ChannelMonitor
+from spectral import SpectrumAnalyzer, SPECTRUM_WINDOW, SPECTRUM_INTERVAL
+from strip_chart import decimate_series, STRIP_CHART_CAPACITY, STRIP_CHART_INTERVAL
+
+
+class StartupTimer:
+    # wall-clock time of each start-up phase, measured from the first import
+    def __init__(self):
+        self.last = STARTUP_T0
+        self.phases = []
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    def report(self):
+        breakdown = ', '.join('%s %.3f s' % (phase, seconds) for phase, seconds in self.phases)
+        print(f'start-up: {breakdown} (total {self.last - STARTUP_T0:.3f} s)')
+
+
+class ModelBuilder(qtc.QObject):
+    # builds the model on the acquisition thread, so its blocking connects never stall the window
+    model_ready_signal = qtc.pyqtSignal(object)
+
+    def __init__(self, create_model):
+        super().__init__()
+        self.create_model = create_model
+
+    def build(self):
+        self.model_ready_signal.emit(self.create_model())
 
 
 class OculusController(qtc.QObject):
+    # starts acquisition once the model is handed over and its signals are connected
+    start_acquisition_signal = qtc.pyqtSignal()
 
-    realtime_scandata_modified_signal = qtc.pyqtSignal()
-    scan_start_stop_signal = qtc.pyqtSignal(int)
 
-    def __init__(self, root, stump):
+    def __init__(self, root, stump, mode='standalone', replay_file=None, replay_rate=0):
         super().__init__()
+        self.startup_timer = StartupTimer()
+        self.startup_timer.mark('imports')
 
-        # create references to the model and view
-        self.model = CoreData(root, stump)
+        # the view comes first so the window can be shown before any CA traffic
+        # the model (and the epics import) is created in finish_startup
+        self.root = root
+        self.stump = stump
+        self.mode = mode
+        self.replay_file = replay_file
+        self.replay_rate = replay_rate
+        self.model = None
         self.view = PyQtView(self)
+        self.startup_timer.mark('main window')
 
-        # create real-time scan activity PVs
-        self.val = PV(self.model.trunk + 'VAL')
-        self.data = PV(self.model.trunk + 'DATA')
-        self.cpt = PV(self.model.trunk + 'CPT')
-        self.npts = PV(self.model.trunk + 'NPTS')
-        # add callbacks (after connection is established)
-        self.val.wait_for_connection()
-        self.val.add_callback(self.val_triggered)
-        self.data.wait_for_connection()
-        self.data.add_callback(self.data_triggered)
+        # the model owns all CA I/O and the scan buffers and lives on its own thread
+        self.acquisition_thread = qtc.QThread()
+        self.model_builder = None
+        self.publisher = None
+
+        # real-time scan activity PVs (owned by the model), None until the model is ready
+        self.data = None
+        self.cpt = None
+        self.npts = None
 
         # file management PVs
 
         # create a variable to hold total number of scan points
         self.num_points = 11
 
+        # archived scans (mda_cache.ArchivedScan) overlaid on the live plot
+        self.overlay_scans = []
+
+        # live fits of the visible detectors run on a thread pool
+        self.fit_engine = FitEngine()
+
+        # on-demand sampling profile of every thread, started from the File menu
+        self.profiler = SamplingProfiler()
+
+        # finished scans are optionally written out on a background writer thread
+        self.exporter = ScanExporter()
+
+        # the archive statistics index is brought up to date off the GUI thread
+        self.indexer = ThreadPoolExecutor(max_workers=1)
+
+        # running sum of repeated scans, fed when each scan finishes
+        self.accumulator = ScanAccumulator()
+
+        # y-range and horizontal markers follow these instead of rescanning every curve
+        self.y_bounds = RunningBounds()
+
+        # rolling spectra of the visible detectors, sampled at their monitor rate
+        self.spectrum_monitor = ChannelMonitor(4 * SPECTRUM_WINDOW)
+        self.spectrum_analyzer = SpectrumAnalyzer()
+        self.spectrum_timer = qtc.QTimer(self)
+        self.spectrum_timer.setInterval(SPECTRUM_INTERVAL)
+        self.spectrum_timer.timeout.connect(self.refresh_spectrum)
+
+        # strip chart of the checked detectors between scans, recorded at their monitor rate
+        self.strip_monitor = ChannelMonitor(STRIP_CHART_CAPACITY)
+        self.strip_timer = qtc.QTimer(self)
+        self.strip_timer.setInterval(STRIP_CHART_INTERVAL)
+        self.strip_timer.timeout.connect(self.refresh_strip_chart)
+
+        # detector list previews refresh on a slow timer, not per point
+        self.sparkline_timer = qtc.QTimer(self)
+        self.sparkline_timer.setInterval(SPARKLINE_INTERVAL)
+        self.sparkline_timer.timeout.connect(self.refresh_sparklines)
+
         # connect signals to slots
-        self.realtime_scandata_modified_signal.connect(self.update_realtime_scandata)
-        self.scan_start_stop_signal.connect(self.initialize_finalize_scan)
+        self.fit_engine.fit_ready_signal.connect(self.update_fit)
+        self.view.fit_model_combo.currentTextChanged.connect(self.change_fit_model)
 
     def startup_sequence(self):
+        self.view.show()
+        self.startup_timer.mark('first window')
+        # let the window paint, then build the rest one stage per event-loop pass
+        qtc.QTimer.singleShot(0, self.build_deferred_widgets)
+
+    def build_deferred_widgets(self):
+        self.view.build_detectors_control()
+        self.startup_timer.mark('detector panel')
+        qtc.QTimer.singleShot(0, self.finish_startup)
+
+    def finish_startup(self):
+        # the model is built on the acquisition thread; attach_model picks it up when it is ready
+        self.model_builder = ModelBuilder(self.create_model)
+        self.model_builder.moveToThread(self.acquisition_thread)
+        self.model_builder.model_ready_signal.connect(self.attach_model)
+        self.acquisition_thread.started.connect(self.model_builder.build)
+        self.acquisition_thread.start()
+
+    def create_model(self):
+        # runs on the acquisition thread; pyepics is only imported here, after the window is up
+        if self.mode == 'client':
+            from fanout import RemoteCoreData
+            return RemoteCoreData(self.root, self.stump)
+        elif self.mode == 'replay':
+            from replay import ReplayCoreData
+            return ReplayCoreData(self.replay_file, self.replay_rate)
+        from oculus3_v0_core import CoreData
+        return CoreData(self.root, self.stump)
+
+    def attach_model(self, model):
+        self.model = model
+        self.startup_timer.mark('model')
+        self.start_acquisition_signal.connect(self.model.start_acquisition)
+
+        # re-broadcast snapshots to thin clients from the acquisition thread
+        if self.mode == 'publisher':
+            from fanout import SnapshotPublisher
+            self.publisher = SnapshotPublisher(self.model)
+            self.publisher.moveToThread(self.acquisition_thread)
+            self.start_acquisition_signal.connect(self.publisher.start)
+
+        self.data = self.model.data
+        self.cpt = self.model.cpt
+        self.npts = self.model.npts
+
+        self.model.snapshot_ready_signal.connect(self.update_realtime_scandata)
+        self.model.scan_state_signal.connect(self.initialize_finalize_scan)
+        self.model.status_signal.connect(self.view.statusBar().showMessage)
+
+        self.start_acquisition_signal.emit()
+        self.sparkline_timer.start()
         self.update_gui_positioner_names()
         self.update_gui_detector_names()
-        self.view.show()
-        # print(self.view.file_control.size())
+        self.startup_timer.mark('names')
+        self.startup_timer.report()
+        self.indexer.submit(self.index_scan_directory, self.current_file_path())
 
-    def load_new_data(self, text):
-        # get the current file path for opening or building new filename
+    def shutdown(self):
+        if self.profiler.running:
+            self.toggle_profiling()
+        self.spectrum_timer.stop()
+        self.spectrum_monitor.unwatch_all()
+        self.strip_timer.stop()
+        self.strip_monitor.unwatch_all()
+        self.fit_engine.shutdown()
+        self.exporter.shutdown()
+        # an interrupted pass loses nothing; the next one picks up where it stopped
+        self.indexer.shutdown(wait=False, cancel_futures=True)
+        self.acquisition_thread.quit()
+        self.acquisition_thread.wait()
+
+    def toggle_profiling(self):
+        if not self.profiler.running:
+            self.profiler.start()
+            self.view.profile_action.setText('Stop profiling')
+            return
+        # name the profile after the scan it covers, e.g. oculus_profile_xyz_0012_20261019-101500.folded
+        scan_file = self.model.file_name_display.value if self.model is not None else ''
+        stem = os.path.splitext(scan_file or '')[0] or 'noscan'
+        stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(self.profiler.started))
+        directory = os.path.join(os.path.expanduser('~'), '.oculus3', 'profiles')
+        os.makedirs(directory, exist_ok=True)
+        path = self.profiler.stop(os.path.join(directory, f'oculus_profile_{stem}_{stamp}.folded'))
+        self.view.profile_action.setText('Start profiling')
+        print(f'profile of {self.profiler.num_samples} samples saved to {path}')
+
+    def current_file_path(self):
+        if self.model is None:
+            return ''
         fsystem = self.model.file_path_fs.value
         fsubdir = self.model.file_path_sd.value
         if fsubdir:
-            fpath = f'{fsystem}/{fsubdir}'
+            return f'{fsystem}/{fsubdir}'
         else:
-            fpath = fsystem
+            return fsystem
+
+    def load_new_data(self, text):
+        # get the current file path for opening or building new filename
+        fpath = self.current_file_path()
         if text == 'Load data':
             # use browses filesystem for new filename
             fname, fext = qtw.QFileDialog.getOpenFileName(directory=fpath, filter='mda files (*.mda)')
@@ -74,7 +244,11 @@ class OculusController(qtc.QObject):
                 new_fnumber = int(current_fnumber) + 1
             new_tail = current_tail.replace(current_fnumber, str(new_fnumber).zfill(fill_length))
             fname = f'{fpath}/{new_tail}'
+        self.open_data_file(fname)
+
+    def open_data_file(self, fname):
         if os.path.isfile(fname):
+            import mda
             head, tail = os.path.split(fname)
             self.view.file_path_ledit.setText(head)
             self.view.file_name_ledit.setText(tail)
@@ -82,64 +256,262 @@ class OculusController(qtc.QObject):
         else:
             print('no file to open')
 
+    def index_scan_directory(self, directory):
+        # runs on the indexer thread
+        if not directory or not os.path.isdir(directory):
+            return
+        import sqlite3
+        from scan_index import ScanIndex
+        try:
+            indexed = ScanIndex().update(directory)
+        except (ImportError, OSError, sqlite3.Error) as error:
+            print('could not index', directory, error)
+            return
+        if indexed:
+            print(f'indexed {indexed} scan files in {directory}')
+
+    def search_archive(self):
+        from scan_index import ScanIndex, parse_query, describe
+        text, ok = qtw.QInputDialog.getText(self.view, 'Search archive',
+                                            'Detector and ranges, e.g. D05 peak>=1e5 x_peak=12.2:12.4')
+        if not ok or not text.strip():
+            return
+        try:
+            rows = ScanIndex().query(*parse_query(text))
+        except ValueError as error:
+            self.view.statusBar().showMessage(f'search not understood: {error}')
+            return
+        if not rows:
+            self.view.statusBar().showMessage('no indexed scan matches')
+            return
+        items = [describe(row) for row in rows]
+        item, ok = qtw.QInputDialog.getItem(self.view, 'Search archive', f'{len(rows)} matches, newest first',
+                                            items, 0, False)
+        if ok:
+            self.open_data_file(rows[items.index(item)]['path'])
+
+    def add_overlays(self):
+        from mda_cache import load_archived_scan
+        fnames, fext = qtw.QFileDialog.getOpenFileNames(directory=self.current_file_path(),
+                                                         filter='mda files (*.mda)')
+        for fname in fnames:
+            try:
+                self.overlay_scans.append(load_archived_scan(fname))
+            except (OSError, IndexError, AttributeError):
+                print('could not read', fname)
+        self.refresh_overlays()
+
+    def clear_overlays(self):
+        self.overlay_scans = []
+        self.view.clear_overlays()
+
+    def refresh_overlays(self):
+        # redraw every overlay against the current horizontal axis
+        self.view.clear_overlays()
+        n = self.view.active_horizontal_axis_combo.currentIndex() + 1
+        for scan in self.overlay_scans:
+            x_values = scan.positioner(n)
+            for key in scan.arrays:
+                if key.startswith('D') and key in self.view.dnncv:
+                    label = f'{scan.tail} {scan.names[key]}'
+                    self.view.add_overlay(key, x_values, scan.arrays[key], label)
+
+    def add_virtual_channel(self):
+        text, ok = qtw.QInputDialog.getText(self.view, 'Add virtual channel',
+                                            'Expression (e.g. D03/D01, D04+D05, log(D02/D01))')
+        if ok and text and self.model is not None:
+            self.model.add_virtual_channel_signal.emit(text)
+
+    def clear_virtual_channels(self):
+        if self.model is None:
+            return
+        self.model.clear_virtual_channels_signal.emit()
+        for i in range(1, constants.NUM_VIRTUAL_DETECTORS + 1):
+            self.view.detector_list.set_name('V%2.2iCV' % i, '')
+
     def update_active_positioner(self, index):
-        if index < 0:
+        if index < 0 or self.model is None:
             return
         n = index + 1
         self.update_plot_window_domain(n)
+        if self.overlay_scans:
+            self.refresh_overlays()
 
     def move_active_positioner(self, text):
         # move positioner only if scan is not active
-        if self.data.value:
+        if self.data is not None and self.data.value:
+            from epics import caput
             n = self.view.active_horizontal_axis_combo.currentIndex() + 1
             caput(self.model.pnpv[f'P{n}PV'].value, text)
 
-    # EPICS callbacks
-    def val_triggered(self, **kwargs):
-        return self.realtime_scandata_modified_signal.emit()
+    # PyQtSlots
+    def update_realtime_scandata(self, snapshot):
+        # snapshots queue up while the GUI is busy; only the newest is worth drawing
+        if snapshot.version != self.model.latest_snapshot.version:
+            return
+        # a reconfiguration pass publishes once, so the labels are rebuilt once per burst
+        if not snapshot.scanning and self.model.positioners_modified_flag:
+            self.update_gui_positioner_names()
+        if not snapshot.scanning and self.model.detectors_modified_flag:
+            self.update_gui_detector_names()
+        if snapshot.num_points < 2:
+            return
+        n = self.view.active_horizontal_axis_combo.currentIndex() + 1
+        if f'R{n}CV' not in snapshot.positioners_arrays:
+            return
+        x_values = snapshot.positioners_arrays[f'R{n}CV']
+        self.update_scan_timing(snapshot, x_values)
+        derivative = self.view.test_cbox.isChecked()
+        for detectors in snapshot.detectors_arrays:
+            y_values = snapshot.detectors_arrays[detectors]
+            # derivative test start
+            if derivative:
+                y_values = central_derivative(x_values, y_values)
+            self.view.dnncv[detectors].setData(x_values, y_values)
+            # derivative test end
+        if derivative:
+            # the derivative is recomputed in full each time, so its bounds are too
+            self.view.view_box.enableAutoRange(axis='y')
+            if not self.view.temporary_hline_override:
+                self.view.reset_horizontal_markers()
+        else:
+            self.y_bounds.update(snapshot.detectors_arrays, snapshot.num_points)
+            bounds = self.y_bounds.combined(self.view.visible_detector_keys())
+            if bounds is not None:
+                # overlays and fit curves share the plot, so they must not be clipped
+                for lo, hi in self.view.curve_bounds():
+                    bounds = min(bounds[0], lo), max(bounds[1], hi)
+                self.view.plot_window.setYRange(*bounds)
+                if not self.view.temporary_hline_override:
+                    self.view.set_horizontal_markers(*bounds)
+        self.fit_engine.submit(x_values, snapshot.detectors_arrays, self.view.visible_detector_keys())
+        if snapshot.scanning and self.view.accumulate_action.isChecked() and self.view.is_shown(self.view.accumulate_window):
+            self.show_accumulation()
+
+    def update_scan_timing(self, snapshot, x_values):
+        if not snapshot.timing_arrays:
+            return
+        if snapshot.scanning:
+            rate = timing_series(snapshot.timing_arrays)[2]
+            eta = eta_seconds(snapshot.timing_arrays, snapshot.num_points, self.npts.value or 0)
+            self.view.statusBar().showMessage('point %i/%s   %.2f pts/s   ETA %s' % (
+                snapshot.num_points, self.npts.value, np.nan_to_num(rate[-1]), format_eta(eta)))
+        if self.view.is_shown(self.view.timing_window):
+            self.view.update_timing(x_values, *timing_series(snapshot.timing_arrays))
+
+    def toggle_strip_chart(self, checked):
+        if checked and self.mode == 'client':
+            # the strip chart records the detector PVs directly, which a fan-out client does not have
+            self.view.statusBar().showMessage('the strip chart needs a direct connection to the scan record')
+            self.view.strip_chart_action.setChecked(False)
+            return
+        if checked:
+            self.follow_strip_chart()
+            # DATA is 1 between scans; during a scan the switch happens when it ends
+            if self.model is not None and self.data.value != 0:
+                self.show_strip_chart(True)
+            return
+        self.show_strip_chart(False)
+        self.strip_monitor.unwatch_all()
+        self.view.clear_strip_chart()
 
-    def data_triggered(self, value, **kwargs):
-        return self.scan_start_stop_signal.emit(value)
+    def show_strip_chart(self, show):
+        self.view.show_strip_chart(show)
+        if show:
+            self.refresh_strip_chart()
+            self.strip_timer.start()
+        else:
+            self.strip_timer.stop()
 
-    # PyQtSlots
-    def update_realtime_scandata(self):
-        current_index = self.cpt.get(use_monitor=False) - 1
-        for positioners in self.model.active_positioners_arrays:
-            self.model.active_positioners_arrays[positioners][current_index] = self.model.rncv[positioners].value
+    def clear_strip_chart(self):
+        for ring in self.strip_monitor.rings.values():
+            ring.clear()
+        self.view.clear_strip_chart()
+
+    def follow_strip_chart(self):
+        # recording carries on through scans, so the history has no gaps
+        if self.model is not None:
+            keys = [key_cv for key_cv in self.view.visible_detector_keys() if key_cv.startswith('D')]
+            self.strip_monitor.follow(self.model.dnncv, keys)
+
+    def refresh_strip_chart(self):
+        self.follow_strip_chart()
+        width = self.view.strip_window.width()
+        series = {}
+        for key_cv, ring in self.strip_monitor.rings.items():
+            if len(ring):
+                series[key_cv] = decimate_series(*ring.latest(), width)
+        self.view.update_strip_chart(series)
+
+    def toggle_spectrum(self, checked):
+        if checked and self.mode == 'client':
+            # spectra sample the detector PVs directly, which a fan-out client does not have
+            self.view.statusBar().showMessage('detector spectra need a direct connection to the scan record')
+            self.view.show_spectrum_action.setChecked(False)
+            return
+        self.view.show_spectrum_window(checked)
+        if checked:
+            self.spectrum_timer.start()
+            return
+        self.spectrum_timer.stop()
+        self.spectrum_monitor.unwatch_all()
+        self.spectrum_analyzer.reset()
+        self.view.clear_spectrum()
+
+    def refresh_spectrum(self):
+        if not self.view.is_shown(self.view.spectrum_window):
+            # the window was closed directly
+            self.view.show_spectrum_action.setChecked(False)
+            return
+        if self.model is None:
+            return
+        keys = [key_cv for key_cv in self.view.visible_detector_keys() if key_cv.startswith('D')]
+        self.spectrum_monitor.follow(self.model.dnncv, keys)
+        results = self.spectrum_analyzer.update(self.spectrum_monitor.rings)
+        if results:
+            self.view.update_spectrum(results, keys)
+        if keys and keys[0] in results:
+            self.view.update_spectrogram(keys[0], self.spectrum_analyzer.spectrograms[keys[0]],
+                                         self.spectrum_analyzer.frequencies[keys[0]])
+
+    def refresh_sparklines(self):
+        self.view.update_sparklines(self.model.latest_snapshot.detectors_arrays)
+
+    def change_fit_model(self, text):
+        self.fit_engine.set_model(text)
+        self.view.clear_fits()
+        if self.model is None:
+            return
+        snapshot = self.model.latest_snapshot
         n = self.view.active_horizontal_axis_combo.currentIndex() + 1
-        x_values = self.model.active_positioners_arrays[f'R{n}CV'][:current_index + 1]
-        for detectors in self.model.active_detectors_arrays:
-            self.model.active_detectors_arrays[detectors][current_index] = self.model.dnncv[detectors].value
-            y_values = self.model.active_detectors_arrays[detectors][:current_index + 1]
-            print(y_values)
-            if current_index > 0:
-                # derivative test start
-                # y_values = self.model.active_detectors_arrays[detectors][:current_index + 1]
-                if self.view.test_cbox.isChecked():
-                    x_length = len(x_values)
-                    y_temp = np.zeros(len(y_values))
-                    for x in range(x_length):
-                        if x == 0 or x == x_length - 1:
-                            pass
-                        else:
-                            dy = y_values[x + 1] - y_values[x - 1]
-                            dx = x_values[x + 1] - x_values[x - 1]
-                            y_temp[x] = dy/dx
-                    y_temp[0] = y_temp[1]
-                    y_temp[-1] = y_temp[-2]
-                    y_values = y_temp
-                self.view.dnncv[detectors].setData(x_values, y_values)
-                # derivative test end
-                # self.view.dnncv[detectors].setData(x_values, self.model.active_detectors_arrays[detectors][:current_index + 1])
-        self.view.view_box.enableAutoRange(axis='y')
-        if not self.view.temporary_hline_override:
-            self.view.reset_horizontal_markers()
+        if f'R{n}CV' in snapshot.positioners_arrays and snapshot.num_points > 1:
+            self.fit_engine.submit(snapshot.positioners_arrays[f'R{n}CV'], snapshot.detectors_arrays,
+                                   self.view.visible_detector_keys())
+
+    def update_fit(self, key, model_name, params, num_points):
+        visible = self.view.visible_detector_keys()
+        if params is None or model_name != self.fit_engine.model_name or key not in visible:
+            return
+        x_values = self.view.dnncv[key].getData()[0]
+        if x_values is None or len(x_values) < 2:
+            return
+        x_fine = np.linspace(x_values.min(), x_values.max(), 400)
+        self.view.show_fit(key, x_fine, FIT_MODELS[model_name](x_fine, *params))
+        # the first visible detector sets the center marker
+        if key == visible[0]:
+            self.view.show_fit_center(params[1])
 
     def initialize_finalize_scan(self, value):
         if value == 0:
             print('scan is starting')
             # scan is starting
             self.view.clear_plots()
+            self.view.clear_fits()
+            self.view.clear_sparklines()
+            self.fit_engine.reset()
+            self.y_bounds.reset()
+            if self.view.strip_chart_action.isChecked():
+                self.show_strip_chart(False)
             self.view.temporary_vline_override = False
             self.view.temporary_hline_override = False
             if self.model.positioners_modified_flag:
@@ -151,28 +523,90 @@ class OculusController(qtc.QObject):
         else:
             print('scan is finished')
             # in consider plotting DddDA and PnRA arrays
-            self.num_points = self.cpt.value
-            for positioners in self.model.active_positioners_arrays:
-                print(self.model.active_positioners_arrays[positioners][:self.num_points])
-            for detectors in self.model.active_detectors_arrays:
-                print(self.model.active_detectors_arrays[detectors][:self.num_points])
+            snapshot = self.model.latest_snapshot
+            self.num_points = snapshot.num_points
+            for positioners in snapshot.positioners_arrays:
+                print(snapshot.positioners_arrays[positioners])
+            for detectors in snapshot.detectors_arrays:
+                print(snapshot.detectors_arrays[detectors])
             if not self.view.temporary_hline_override:
                 self.view.reset_horizontal_markers()
             if not self.view.temporary_vline_override:
                 self.view.reset_vertical_markers()
+            self.export_finished_scan(snapshot)
+            if self.view.strip_chart_action.isChecked():
+                self.show_strip_chart(True)
+            # picks up the file of this scan, or of the last one if saveData is still writing it
+            self.indexer.submit(self.index_scan_directory, self.current_file_path())
+            if self.view.accumulate_action.isChecked():
+                self.accumulate_scan(snapshot)
+
+    def toggle_accumulation(self, checked):
+        self.view.show_accumulate_window(checked)
+
+    def reset_accumulation(self):
+        self.accumulator.reset()
+        self.view.clear_accumulation()
+
+    def accumulate_scan(self, snapshot):
+        n = self.view.active_horizontal_axis_combo.currentIndex() + 1
+        if f'R{n}CV' not in snapshot.positioners_arrays or snapshot.num_points < 2:
+            return
+        self.accumulator.add(snapshot.positioners_arrays[f'R{n}CV'], snapshot.detectors_arrays)
+        self.show_accumulation()
+
+    def show_accumulation(self):
+        # while a scan runs, its points so far are shown in the sum without being stored
+        snapshot = self.model.latest_snapshot if self.model is not None else None
+        n = self.view.active_horizontal_axis_combo.currentIndex() + 1
+        live = snapshot is not None and snapshot.scanning and self.view.accumulate_action.isChecked() \
+            and f'R{n}CV' in snapshot.positioners_arrays and snapshot.num_points > 1
+        results = {}
+        for key_cv in self.view.visible_detector_keys():
+            if live and key_cv in snapshot.detectors_arrays:
+                result = self.accumulator.result(key_cv, (snapshot.positioners_arrays[f'R{n}CV'],
+                                                          snapshot.detectors_arrays[key_cv]))
+            else:
+                result = self.accumulator.result(key_cv)
+            if result is not None:
+                results[key_cv] = result
+        self.view.update_accumulation(results, self.accumulator.num_scans + (1 if live else 0))
+
+    def export_finished_scan(self, snapshot):
+        formats = []
+        if self.view.export_csv_action.isChecked():
+            formats.append('csv')
+        if self.view.export_hdf5_action.isChecked():
+            formats.append('hdf5')
+        if not formats:
+            return
+        directory = os.path.join(self.current_file_path() or os.path.expanduser('~'), 'oculus_export')
+        stem = os.path.splitext(self.model.file_name_display.value or '')[0] or 'scan'
+        derivative_of = None
+        if self.view.test_cbox.isChecked():
+            derivative_of = 'R%iCV' % (self.view.active_horizontal_axis_combo.currentIndex() + 1)
+        # the snapshot's arrays are read-only and never rewritten, so the writer uses them as they are
+        for fmt in formats:
+            self.exporter.export(snapshot, directory, stem, fmt, derivative_of)
 
     def update_gui_positioner_names(self):
         self.model.positioners_modified_flag = False
-        self.view.active_horizontal_axis_combo.clear()
-        for positioners in self.model.active_positioners_names:
-            text = self.model.active_positioners_names[positioners]
-            self.view.active_horizontal_axis_combo.addItem(text)
+        combo = self.view.active_horizontal_axis_combo
+        current = combo.currentText()
+        # rebuilt silently, then the plot domain follows the final selection once
+        combo.blockSignals(True)
+        combo.clear()
+        names = self.model.latest_snapshot.positioners_names
+        for positioners in names:
+            combo.addItem(names[positioners])
+        combo.setCurrentIndex(max(combo.findText(current), 0))
+        combo.blockSignals(False)
+        self.update_active_positioner(combo.currentIndex())
 
     def update_gui_detector_names(self):
         self.model.detectors_modified_flag = False
-        for detectors in self.model.active_detectors_names:
-            key_cb = detectors.replace('PV', 'CB')
-            self.view.dnncb[key_cb].setText(self.model.active_detectors_names[detectors])
+        # only rows whose name actually changed are repainted
+        self.view.detector_list.set_names(self.model.latest_snapshot.detectors_names)
 
     def update_plot_window_domain(self, n):
         if self.data.value:
@@ -200,6 +634,20 @@ class OculusController(qtc.QObject):
 if __name__ == '__main__':
     app = qtw.QApplication(sys.argv)
     crate, scann = '16test:', 'scan1.'
-    controller = OculusController(crate, scann)
+    replay_file, replay_rate = None, 0
+    if '--publisher' in sys.argv:
+        mode = 'publisher'
+    elif '--client' in sys.argv:
+        mode = 'client'
+    elif '--replay' in sys.argv:
+        # --replay file.mda [--rate points_per_second], rate 0 (default) is as fast as possible
+        mode = 'replay'
+        replay_file = sys.argv[sys.argv.index('--replay') + 1]
+        if '--rate' in sys.argv:
+            replay_rate = float(sys.argv[sys.argv.index('--rate') + 1])
+    else:
+        mode = 'standalone'
+    controller = OculusController(crate, scann, mode, replay_file, replay_rate)
+    app.aboutToQuit.connect(controller.shutdown)
     controller.startup_sequence()
     sys.exit(app.exec_())
@@ -1,9 +1,7 @@
 import sys
 from PyQt5 import QtWidgets as qtw
 from PyQt5 import QtCore as qtc
-import numpy as np
-from epics import PV, caget
-import constants
+from scan_core import ScanCore
 
 
 class MainWindow(qtw.QMainWindow):
@@ -13,195 +11,48 @@ class MainWindow(qtw.QMainWindow):
         self.setWindowTitle('Oculus')
 
 
-class CoreData(qtc.QObject):
-    # class attributes to build the positioner dictionary pnpv, including:
-    # pv, name, p0, min, center, max, step, width, scan mode, abs/rel, and readback array
-    pos_attrs = ('PV', 'NV', 'PP', 'SP', 'CP', 'EP', 'SI', 'WD', 'SM', 'AR', 'RA')
+class CoreData(ScanCore, qtc.QObject):
+    # ScanCore driven by the Qt event loop of the acquisition thread, reporting through signals
 
     # PyQt Signals
-    active_positioners_modified_signal = qtc.pyqtSignal(str)
-    active_detectors_modified_signal = qtc.pyqtSignal(str)
+    ca_event_signal = qtc.pyqtSignal(object, object)
+    snapshot_ready_signal = qtc.pyqtSignal(object)
+    scan_state_signal = qtc.pyqtSignal(int)
+    add_virtual_channel_signal = qtc.pyqtSignal(str)
+    clear_virtual_channels_signal = qtc.pyqtSignal()
+    status_signal = qtc.pyqtSignal(str)
 
     def __init__(self, root, stump):
-        super().__init__()
+        qtc.QObject.__init__(self)
+
+        # CA callbacks reach the acquisition thread as queued signals
+        self.ca_event_signal.connect(self.dispatch)
+        self.add_virtual_channel_signal.connect(self.add_virtual_channel)
+        self.clear_virtual_channels_signal.connect(self.clear_virtual_channels)
+
+        # changed channels are resolved in one batch once a burst of changes is over
+        self.resolve_timer = qtc.QTimer(self)
+        self.resolve_timer.setSingleShot(True)
+        self.resolve_timer.timeout.connect(lambda: self.dispatch(self.resolve_pending, ()))
+
+        ScanCore.__init__(self, root, stump)
+
+    def post(self, handler, *args):
+        self.ca_event_signal.emit(handler, args)
+
+    def schedule_resolve(self):
+        # restarting the timer pushes the pass back to the end of the burst
+        self.resolve_timer.start(int(self.resolve_delay() * 1000))
+
+    def snapshot_ready(self, snapshot):
+        self.snapshot_ready_signal.emit(snapshot)
+
+    def scan_state_changed(self, value):
+        self.scan_state_signal.emit(value)
 
-        '''
-        create empty core data dictionaries, including:
-        
-        Several positioner PVs (see class pos_attrs)
-        Readback current value
-        
-        Detector PVs
-        Name valids
-        Current values
-        Final data arrays
-        '''
-
-        self.pnpv = {}
-        self.rncv = {}
-
-        self.dnnpv = {}
-        self.dnnnv = {}
-        self.dnncv = {}
-        self.dnnda = {}
-
-        '''
-        Create dictionaries to hold the real-time scan results (np.arrays)
-        and names for active positioners and detectors
-        '''
-
-        self.active_positioners_arrays = {}
-        self.active_positioners_names = {}
-        self.active_detectors_arrays = {}
-        self.active_detectors_names = {}
-
-        # combine ioc prefix with scan number to generate PV trunk
-        # note that stump should end in a dot (e.g., 'scan1.')
-        self.root = root
-        self.stump = stump
-        self.trunk = root + stump
-
-        # create Positioner PVs and add to existing dictionaries
-        for i in range(1, constants.NUM_POSITIONERS + 1):
-            for a in CoreData.pos_attrs:
-                key_pnpv = 'P%i%s' % (i, a)
-                self.pnpv[key_pnpv] = PV(self.trunk + key_pnpv)
-                if a == 'PV':
-                    self.pnpv[key_pnpv].wait_for_connection()
-                    self.pnpv[key_pnpv].add_callback(self.positioners_modified)
-            key_rncv = 'R%iCV' % i
-            self.rncv[key_rncv] = PV(self.trunk + key_rncv)
-
-        # create detector PVs and add to existing dictionaries
-        for i in range(1, constants.NUM_DETECTORS + 1):
-            key_pv = 'D%2.2iPV' % i
-            key_nv = 'D%2.2iNV' % i
-            key_cv = 'D%2.2iCV' % i
-            key_da = 'D%2.2iDA' % i
-            self.dnnpv[key_pv] = PV(self.trunk + key_pv)
-            self.dnnnv[key_nv] = PV(self.trunk + key_nv)
-            self.dnncv[key_cv] = PV(self.trunk + key_cv)
-            self.dnnda[key_da] = PV(self.trunk + key_da)
-            # add callback to DnnPV (after connection is established)
-            self.dnnpv[key_pv].wait_for_connection()
-            self.dnnpv[key_pv].add_callback(self.detectors_modified)
-
-        # create saveData PVs for file management
-        self.file_path_fs = PV(root + 'saveData_fileSystem')
-        self.file_path_sd = PV(root + 'saveData_subDir')
-        self.file_path_display = PV(root + 'saveData_fullPathName')
-        self.file_name_display = PV(root + 'saveData_fileName')
-
-        # flags to indicate if positioners, detectors, path have been modified
-        self.positioners_modified_flag = True
-        self.detectors_modified_flag = True
-
-        # connect signals to slots
-        self.active_positioners_modified_signal.connect(self.update_active_positioner)
-        self.active_detectors_modified_signal.connect(self.update_active_detector)
-
-        # fill active positioner and detector arrays on program start
-        self.initialize_active_positioners()
-        self.initialize_active_detectors()
-
-    # EPICS callbacks
-    def positioners_modified(self, pvname, **kwargs):
-        self.positioners_modified_flag = True
-        return self.active_positioners_modified_signal.emit(pvname)
-
-    def detectors_modified(self, pvname, **kwargs):
-        self.detectors_modified_flag = True
-        return self.active_detectors_modified_signal.emit(pvname)
-
-    def update_active_positioner(self, pvname):
-        n = pvname[-3]
-        validity = caget(self.trunk + f'P{n}NV', use_monitor=False)
-        if validity == 0:
-            self.active_positioners_arrays[f'R{n}CV'] = np.zeros(constants.MAX_NUM_POINTS)
-            self.update_active_positioners_names(n)
-        else:
-            if f'R{n}CV' in self.active_positioners_arrays:
-                del self.active_positioners_arrays[f'R{n}CV']
-                del self.active_positioners_names[f'P{n}PV']
-
-    def update_active_detector(self, pvname):
-        nn = pvname[-4:-2]
-        validity = caget(self.trunk + f'D{nn}NV', use_monitor=False)
-        if validity == 0:
-            self.active_detectors_arrays[f'D{nn}CV'] = np.zeros(constants.MAX_NUM_POINTS)
-            self.update_active_detectors_names(nn)
-        else:
-            if f'D{nn}CV' in self.active_detectors_arrays:
-                del self.active_detectors_arrays[f'D{nn}CV']
-                del self.active_detectors_names[f'D{nn}PV']
-
-    def update_active_positioners_names(self, n):
-        # either get a proper motor name or just identify by PV name
-        if '.' in self.pnpv[f'P{n}PV'].value:
-            new_trunk = self.pnpv[f'P{n}PV'].value.rsplit('.')[0]
-            record_type = caget(new_trunk + '.RTYP')
-            if record_type == 'motor':
-                description = caget(new_trunk + '.DESC')
-                if description:
-                    name = f' ({description})'
-                else:
-                    name = ''
-            else:
-                name = ''
-        else:
-            name = ''
-        # self.active_positioners_names[f'P{n}PV'] = name
-        self.active_positioners_names[f'P{n}PV'] = self.pnpv[f'P{n}PV'].value + name
-
-    def update_active_detectors_names(self, nn):
-        if '.' in self.dnnpv[f'D{nn}PV'].value:
-            new_trunk = self.dnnpv[f'D{nn}PV'].value.rsplit('.')[0]
-            new_branch = '.' + self.dnnpv[f'D{nn}PV'].value.rsplit('.')[1]
-            record_type = caget(new_trunk + '.RTYP')
-            if record_type == 'scaler':
-                if '.S' in new_branch:
-                    name_branch = new_branch.replace('S', 'NM')
-                    description = caget(new_trunk + name_branch)
-                    if description:
-                        name = f' ({description})'
-                    else:
-                        name = ''
-                elif '.T' in new_branch:
-                    name = ' (Elapsed Time)'
-                else:
-                    name = ''
-            elif record_type == 'transform':
-                name_branch = new_branch[:1] + 'CMT' + new_branch[1:]
-                description = caget(new_trunk + name_branch)
-                if description:
-                    name = f' ({description})'
-                else:
-                    name = ''
-            elif record_type == 'mca':
-                name_branch = new_branch + 'NM'
-                description = caget(new_trunk + name_branch)
-                if description:
-                    name = f' ({description})'
-                else:
-                    name = ''
-            else:
-                name = ''
-        else:
-            name = ''
-        self.active_detectors_names[f'D{nn}PV'] = self.dnnpv[f'D{nn}PV'].value + name
-
-    def initialize_active_positioners(self):
-        for n in range(1, constants.NUM_POSITIONERS + 1):
-            if self.pnpv[f'P{n}NV'].value == 0:
-                self.active_positioners_arrays[f'R{n}CV'] = np.zeros(constants.MAX_NUM_POINTS)
-                self.update_active_positioners_names(n)
-
-    def initialize_active_detectors(self):
-        for i in range(1, constants.NUM_DETECTORS + 1):
-            nn = '%2.2i' % i
-            if self.dnnnv[f'D{nn}NV'].value == 0:
-                self.active_detectors_arrays[f'D{nn}CV'] = np.zeros(constants.MAX_NUM_POINTS)
-                self.update_active_detectors_names(nn)
+    def report_status(self, message):
+        super().report_status(message)
+        self.status_signal.emit(message)
 
 
 if __name__ == '__main__':
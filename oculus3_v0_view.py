@@ -5,17 +5,15 @@ from PyQt5 import QtGui as qtg
 import pyqtgraph as pg
 import constants
 import numpy as np
-from epics import PV, caget
-from epics.devices import Scan
-import time
-import os
-from pyqtgraph.graphicsItems.LegendItem import ItemSample
-from detector_checkbox import Window
+from sparklines import SparklineCache
+from detector_list import DetectorListModel, KEY_COLUMN, NAME_COLUMN, SPARKLINE_COLUMN
+from kernels import crossings
 
 
 class PyQtView(qtw.QMainWindow):
     def __init__(self, controller):
         super().__init__()
+        self.controller = controller
 
         self.setGeometry(100, 100, 1080, 720)
         self.setWindowTitle('Oculus')
@@ -39,11 +37,58 @@ class PyQtView(qtw.QMainWindow):
         # actions
         self.close_oculus_action = qtw.QAction('Exit', self)
         self.close_oculus_action.setShortcut('Ctrl+Q')
+        self.export_csv_action = qtw.QAction('Export finished scans as CSV', self, checkable=True)
+        self.export_hdf5_action = qtw.QAction('Export finished scans as HDF5', self, checkable=True)
+        self.profile_action = qtw.QAction('Start profiling', self)
+        self.search_archive_action = qtw.QAction('Search archive...', self)
+        self.add_overlays_action = qtw.QAction('Add overlays...', self)
+        self.clear_overlays_action = qtw.QAction('Clear overlays', self)
+        self.show_timing_action = qtw.QAction('Show point timing', self, checkable=True)
+        self.show_spectrum_action = qtw.QAction('Show detector spectrum', self, checkable=True)
+        self.accumulate_action = qtw.QAction('Accumulate finished scans', self, checkable=True)
+        self.reset_accumulation_action = qtw.QAction('Reset sum', self)
+        self.strip_chart_action = qtw.QAction('Strip chart between scans', self, checkable=True)
+        self.clear_strip_chart_action = qtw.QAction('Clear history', self)
+        self.add_virtual_channel_action = qtw.QAction('Add virtual channel...', self)
+        self.clear_virtual_channels_action = qtw.QAction('Clear virtual channels', self)
 
         # make menu, add headings, add actions
         self.main_menu = self.menuBar()
         self.file_menu = self.main_menu.addMenu('File')
+        self.file_menu.addAction(self.export_csv_action)
+        self.file_menu.addAction(self.export_hdf5_action)
+        self.file_menu.addSeparator()
+        self.file_menu.addAction(self.search_archive_action)
+        self.file_menu.addAction(self.profile_action)
         self.file_menu.addAction(self.close_oculus_action)
+        self.overlays_menu = self.main_menu.addMenu('Overlays')
+        self.overlays_menu.addAction(self.add_overlays_action)
+        self.overlays_menu.addAction(self.clear_overlays_action)
+        self.virtual_menu = self.main_menu.addMenu('Virtual')
+        self.virtual_menu.addAction(self.add_virtual_channel_action)
+        self.virtual_menu.addAction(self.clear_virtual_channels_action)
+        self.accumulate_menu = self.main_menu.addMenu('Accumulate')
+        self.accumulate_menu.addAction(self.accumulate_action)
+        self.accumulate_menu.addAction(self.reset_accumulation_action)
+        self.strip_chart_menu = self.main_menu.addMenu('Strip chart')
+        self.strip_chart_menu.addAction(self.strip_chart_action)
+        self.strip_chart_menu.addAction(self.clear_strip_chart_action)
+        self.diagnostics_menu = self.main_menu.addMenu('Diagnostics')
+        self.diagnostics_menu.addAction(self.show_timing_action)
+        self.diagnostics_menu.addAction(self.show_spectrum_action)
+
+        # connect menu actions to controller
+        self.profile_action.triggered.connect(lambda: controller.toggle_profiling())
+        self.show_spectrum_action.toggled.connect(lambda checked: controller.toggle_spectrum(checked))
+        self.search_archive_action.triggered.connect(lambda: controller.search_archive())
+        self.accumulate_action.toggled.connect(lambda checked: controller.toggle_accumulation(checked))
+        self.reset_accumulation_action.triggered.connect(lambda: controller.reset_accumulation())
+        self.strip_chart_action.toggled.connect(lambda checked: controller.toggle_strip_chart(checked))
+        self.clear_strip_chart_action.triggered.connect(lambda: controller.clear_strip_chart())
+        self.add_overlays_action.triggered.connect(lambda: controller.add_overlays())
+        self.clear_overlays_action.triggered.connect(lambda: controller.clear_overlays())
+        self.add_virtual_channel_action.triggered.connect(lambda: controller.add_virtual_channel())
+        self.clear_virtual_channels_action.triggered.connect(lambda: controller.clear_virtual_channels())
 
         '''
         Left side
@@ -57,7 +102,20 @@ class PyQtView(qtw.QMainWindow):
         self.plot_window.setLabel('left', y_axis_label, **label_style)
         self.plot_item = self.plot_window.getPlotItem()
         self.view_box = self.plot_item.getViewBox()
-        self.left_side_layout.addWidget(self.plot_window)
+
+        # strip chart, timing, accumulation and spectrum windows are built on first use
+        self.plot_stack = qtw.QStackedWidget()
+        self.plot_stack.addWidget(self.plot_window)
+        self.left_side_layout.addWidget(self.plot_stack)
+        self.label_style = label_style
+        self.strip_window = None
+        self.strip_items = {}
+        self.timing_window = None
+        self.accumulate_window = None
+        self.accumulate_items = {}
+        self.spectrum_window = None
+        self.spectrum_items = {}
+        self.show_timing_action.toggled.connect(self.show_timing_window)
 
         # keep track of visible data items
         self.visible_plot_data_items = 0
@@ -94,11 +152,17 @@ class PyQtView(qtw.QMainWindow):
                 keywords = {'pen': {'color': j, 'width': width}, 'symbolBrush': j, 'symbolPen': j, 'symbol': i, 'symbolSize': symbol_size}
                 line_style_list.append(keywords)
 
-        # create the pyqtgraph PlotDataItems
+        # line styles per detector (virtual channels take the styles after the detectors)
+        # the PlotDataItems themselves are created in build_detectors_control
         self.dnncv = {}
+        self.line_styles = {}
         for i in range(1, constants.NUM_DETECTORS + 1):
-            key_cv = 'D%2.2iCV' % i
-            self.dnncv[key_cv] = pg.PlotDataItem(name=key_cv, **line_style_list[i - 1])
+            self.line_styles['D%2.2iCV' % i] = line_style_list[i - 1]
+        for i in range(1, constants.NUM_VIRTUAL_DETECTORS + 1):
+            self.line_styles['V%2.2iCV' % i] = line_style_list[constants.NUM_DETECTORS + i - 1]
+
+        # archived scans overlaid on the live plot, keyed like dnncv
+        self.overlay_items = {}
 
         # create, add, and connect movable vertical and horizontal lines
         self.vline_min = pg.InfiniteLine(pos=-0.3, angle=90, pen='b', movable=True)
@@ -115,6 +179,12 @@ class PyQtView(qtw.QMainWindow):
         self.plot_window.addItem(self.hline_mid)
         self.plot_window.addItem(self.hline_max)
 
+        # fitted curves per detector and a marker at the fitted center
+        self.fit_items = {}
+        self.fit_line = pg.InfiniteLine(pos=0.0, angle=90, pen={'color': 'g', 'style': qtc.Qt.DashLine}, movable=False)
+        self.fit_line.hide()
+        self.plot_window.addItem(self.fit_line)
+
         # overrides will allow user to drag lines during realtime plot
         self.temporary_vline_override = False
         self.temporary_hline_override = False
@@ -228,11 +298,15 @@ class PyQtView(qtw.QMainWindow):
         self.vax_hline_max_position_button = qtw.QPushButton('')
         self.vax_hline_markers_width = qtw.QLineEdit()
 
+        self.fit_center_label = qtw.QLabel('Fit center')
+        self.fit_center_button = qtw.QPushButton('')
+
         # connect signals to slots
         self.active_horizontal_axis_combo.currentIndexChanged.connect(controller.update_active_positioner)
         self.hax_vline_min_position_button.clicked.connect(lambda: controller.move_active_positioner(self.hax_vline_min_position_button.text()))
         self.hax_vline_mid_position_button.clicked.connect(lambda: controller.move_active_positioner(self.hax_vline_mid_position_button.text()))
         self.hax_vline_max_position_button.clicked.connect(lambda: controller.move_active_positioner(self.hax_vline_max_position_button.text()))
+        self.fit_center_button.clicked.connect(lambda: controller.move_active_positioner(self.fit_center_button.text()))
 
         # add position control widgets to position control groupbox
         self.position_control_layout.addWidget(self.active_element_label, 0, 1, 1, 2)
@@ -255,6 +329,9 @@ class PyQtView(qtw.QMainWindow):
         self.position_control_layout.addWidget(self.vax_hline_max_position_button, 2, 5)
         self.position_control_layout.addWidget(self.vax_hline_markers_width, 2, 6)
 
+        self.position_control_layout.addWidget(self.fit_center_label, 3, 0)
+        self.position_control_layout.addWidget(self.fit_center_button, 3, 4)
+
         '''
         Detectors Window
         '''
@@ -266,30 +343,37 @@ class PyQtView(qtw.QMainWindow):
         self.detectors_control.setLayout(self.detectors_control_layout)
         self.right_side_layout.addWidget(self.detectors_control)
 
-        self.detectors_tab_widget = qtw.QTabWidget()
-        self.detectors_control_layout.addWidget(self.detectors_tab_widget)
-
-        # create dictionary of QCheckBox to toggle visibility of active detectors
-        self.dnncb = {}
-        num_tabs = constants.NUM_DETECTORS // 10
-        for i in range(num_tabs):
-            detectors_tab = qtw.QWidget()
-            detectors_tab_layout = qtw.QVBoxLayout()
-            detectors_tab.setLayout(detectors_tab_layout)
-            for j in range(10):
-                number = i * 10 + 1 + j
-                key_cb = 'D%2.2iCB' % number
-                h_layout = qtw.QHBoxLayout()
-                d_label = qtw.QLabel(key_cb[:3])
-                d_label.setFixedWidth(30)
-                self.dnncb[key_cb] = qtw.QCheckBox()
-                self.dnncb[key_cb].stateChanged.connect(self.det_cbox_toggled)
-                h_layout.addWidget(d_label)
-                h_layout.addWidget(self.dnncb[key_cb])
-                detectors_tab_layout.addLayout(h_layout)
-            label_min = i * 10 + 1
-            label_max = label_min + 9
-            self.detectors_tab_widget.addTab(detectors_tab, f'{label_min} - {label_max}')
+        # live previews next to each name, drawn from shared cached pixmaps
+        self.sparkline_cache = SparklineCache()
+
+        # one model row per channel (key, checkable name, sparkline), shown through a name filter
+        self.detector_list = DetectorListModel(self.sparkline_cache.blank, self)
+        self.detector_filter = qtc.QSortFilterProxyModel(self)
+        self.detector_filter.setSourceModel(self.detector_list)
+        self.detector_filter.setFilterKeyColumn(-1)
+        self.detector_filter.setFilterCaseSensitivity(qtc.Qt.CaseInsensitive)
+        self.detector_filter_ledit = qtw.QLineEdit()
+        self.detector_filter_ledit.setPlaceholderText('Filter detectors')
+        self.detector_filter_ledit.setClearButtonEnabled(True)
+        self.detector_filter_ledit.textChanged.connect(self.detector_filter.setFilterFixedString)
+
+        # the table only paints the rows in view; fixed row heights spare it measuring the rest
+        self.detectors_view = qtw.QTableView()
+        self.detectors_view.setModel(self.detector_filter)
+        self.detectors_view.horizontalHeader().hide()
+        self.detectors_view.verticalHeader().hide()
+        self.detectors_view.setShowGrid(False)
+        self.detectors_view.setSelectionMode(qtw.QAbstractItemView.NoSelection)
+        self.detectors_view.setIconSize(qtc.QSize(self.sparkline_cache.width, self.sparkline_cache.height))
+        self.detectors_view.verticalHeader().setSectionResizeMode(qtw.QHeaderView.Fixed)
+        self.detectors_view.verticalHeader().setDefaultSectionSize(self.sparkline_cache.height + 8)
+        self.detectors_view.horizontalHeader().setSectionResizeMode(NAME_COLUMN, qtw.QHeaderView.Stretch)
+        self.detectors_view.setColumnWidth(KEY_COLUMN, 36)
+        self.detectors_view.setColumnWidth(SPARKLINE_COLUMN, self.sparkline_cache.width + 12)
+        self.detector_list.check_toggled_signal.connect(self.det_cbox_toggled)
+
+        self.detectors_control_layout.addWidget(self.detector_filter_ledit)
+        self.detectors_control_layout.addWidget(self.detectors_view)
 
         '''Windows control'''
 
@@ -306,17 +390,208 @@ class PyQtView(qtw.QMainWindow):
         self.overlays_button = qtw.QPushButton('Overlays')
         self.abort_button = qtw.QPushButton('Abort')
         self.quit_button = qtw.QPushButton('Quit')
+        self.fit_model_combo = qtw.QComboBox()
+        self.fit_model_combo.addItems(['No fit', 'Gaussian', 'Lorentzian', 'Edge'])
 
         # connect signals to slots
         self.test_button.clicked.connect(self.test_button_clicked)
+        self.overlays_button.clicked.connect(lambda: controller.add_overlays())
 
         # add windows control widgets to windows control groupbox
         self.windows_control_layout.addWidget(self.test_cbox)
         self.windows_control_layout.addWidget(self.test_button)
+        self.windows_control_layout.addWidget(self.fit_model_combo)
         self.windows_control_layout.addWidget(self.overlays_button)
         self.windows_control_layout.addWidget(self.abort_button)
         self.windows_control_layout.addWidget(self.quit_button)
 
+    def build_detectors_control(self):
+        # deferred part of start-up: one plot item per detector and virtual channel
+        for key_cv in self.line_styles:
+            self.dnncv[key_cv] = pg.PlotDataItem(name=key_cv, **self.line_styles[key_cv])
+        # rows checked while the items were being built
+        for key_cv in self.detector_list.checked_keys():
+            self.det_cbox_toggled(key_cv, True)
+
+    def build_strip_window(self):
+        # between scans the plot can give way to a strip chart of the monitors against time
+        if self.strip_window is not None:
+            return
+        self.strip_window = pg.PlotWidget(axisItems={'bottom': pg.DateAxisItem()})
+        self.strip_window.setLabel('left', 'Counts', **self.label_style)
+        self.plot_stack.addWidget(self.strip_window)
+
+    def build_timing_window(self):
+        # per-point timing below the scan, sharing its horizontal axis
+        if self.timing_window is not None:
+            return
+        self.timing_window = pg.GraphicsLayoutWidget()
+        self.timing_plot = self.timing_window.addPlot(row=0, col=0)
+        self.timing_plot.setLabel('left', 'Time', units='s')
+        self.timing_plot.addLegend(offset=(-10, 5))
+        self.rate_plot = self.timing_window.addPlot(row=1, col=0)
+        self.rate_plot.setLabel('left', 'Rate', units='pts/s')
+        self.timing_plot.setXLink(self.plot_item)
+        self.rate_plot.setXLink(self.plot_item)
+        self.dwell_item = self.timing_plot.plot(name='dwell', pen='b', symbol='o', symbolSize=3, symbolBrush='b')
+        self.dead_time_item = self.timing_plot.plot(name='dead time', pen='r', symbol='o', symbolSize=3, symbolBrush='r')
+        self.rate_item = self.rate_plot.plot(pen='g', symbol='o', symbolSize=3, symbolBrush='g')
+        self.timing_window.setFixedHeight(200)
+        self.timing_window.hide()
+        self.left_side_layout.insertWidget(self.left_side_layout.indexOf(self.plot_stack) + 1, self.timing_window)
+
+    def build_accumulate_window(self):
+        # separate window for the running sum of repeated scans
+        if self.accumulate_window is not None:
+            return
+        self.accumulate_window = pg.PlotWidget(title='Accumulated scans')
+        self.accumulate_window.setWindowTitle('Oculus - accumulated scans')
+        self.accumulate_window.setLabel('left', 'Summed counts', **self.label_style)
+
+    def build_spectrum_window(self):
+        # separate window for rolling spectra of the visible detectors, and a spectrogram of the first
+        if self.spectrum_window is not None:
+            return
+        self.spectrum_window = pg.GraphicsLayoutWidget()
+        self.spectrum_window.setWindowTitle('Oculus - detector spectrum')
+        self.spectrum_plot = self.spectrum_window.addPlot(row=0, col=0)
+        self.spectrum_plot.setLogMode(y=True)
+        self.spectrum_plot.setLabel('left', 'PSD')
+        self.spectrum_plot.setLabel('bottom', 'Frequency', units='Hz')
+        self.spectrogram_plot = self.spectrum_window.addPlot(row=1, col=0)
+        self.spectrogram_plot.setLabel('left', 'Spectrum (newest at top)')
+        self.spectrogram_plot.setLabel('bottom', 'Frequency', units='Hz')
+        self.spectrogram_image = pg.ImageItem()
+        self.spectrogram_plot.addItem(self.spectrogram_image)
+
+    @staticmethod
+    def is_shown(window):
+        # auxiliary windows that were never built are not showing either
+        return window is not None and window.isVisible()
+
+    def show_timing_window(self, show):
+        if show:
+            self.build_timing_window()
+        if self.timing_window is not None:
+            self.timing_window.setVisible(show)
+
+    def show_accumulate_window(self, show):
+        if show:
+            self.build_accumulate_window()
+        if self.accumulate_window is not None:
+            self.accumulate_window.setVisible(show)
+
+    def show_spectrum_window(self, show):
+        if show:
+            self.build_spectrum_window()
+        if self.spectrum_window is not None:
+            self.spectrum_window.setVisible(show)
+
+    def update_timing(self, x_values, dwell, dead, rate):
+        # NaN entries (e.g. backfilled points) are left out of the curves
+        self.dwell_item.setData(x_values, dwell, connect='finite')
+        self.dead_time_item.setData(x_values, dead, connect='finite')
+        self.rate_item.setData(x_values, rate, connect='finite')
+
+    def update_accumulation(self, results, num_scans):
+        # results maps key_cv -> (x, sum, error) for the detectors to show
+        self.build_accumulate_window()
+        self.accumulate_window.setTitle(f'Accumulated scans ({num_scans})')
+        for key_cv in self.accumulate_items:
+            if key_cv not in results:
+                for item in self.accumulate_items[key_cv]:
+                    item.hide()
+        for key_cv, (x_values, total, error) in results.items():
+            if key_cv not in self.accumulate_items:
+                color = self.line_styles[key_cv]['pen']['color']
+                curve = pg.PlotDataItem(pen={'color': color, 'width': 2})
+                bars = pg.ErrorBarItem(pen=color, beam=0)
+                self.accumulate_window.addItem(curve)
+                self.accumulate_window.addItem(bars)
+                self.accumulate_items[key_cv] = (curve, bars)
+            curve, bars = self.accumulate_items[key_cv]
+            curve.setData(x_values, total)
+            bars.setData(x=x_values, y=total, height=2 * error)
+            curve.show()
+            bars.show()
+
+    def clear_accumulation(self):
+        if self.accumulate_window is None:
+            return
+        for key_cv in self.accumulate_items:
+            for item in self.accumulate_items[key_cv]:
+                self.accumulate_window.removeItem(item)
+        self.accumulate_items = {}
+        self.accumulate_window.setTitle('Accumulated scans')
+
+    def show_strip_chart(self, show):
+        if show:
+            self.build_strip_window()
+        self.plot_stack.setCurrentWidget(self.strip_window if show else self.plot_window)
+
+    def update_strip_chart(self, series):
+        # series maps key_cv -> (times, values), already decimated to the plot width
+        for key_cv in self.strip_items:
+            if key_cv not in series:
+                self.strip_items[key_cv].hide()
+        for key_cv, (times, values) in series.items():
+            if key_cv not in self.strip_items:
+                color = self.line_styles[key_cv]['pen']['color']
+                self.strip_items[key_cv] = self.strip_window.plot(pen={'color': color, 'width': 1})
+            self.strip_items[key_cv].setData(times, values, connect='finite')
+            self.strip_items[key_cv].show()
+
+    def clear_strip_chart(self):
+        if self.strip_window is None:
+            return
+        for key_cv in self.strip_items:
+            self.strip_window.removeItem(self.strip_items[key_cv])
+        self.strip_items = {}
+
+    def update_spectrum(self, results, keys):
+        # results maps key_cv -> (frequencies, psd); the DC bin is left out of the log plot
+        for key_cv in self.spectrum_items:
+            if key_cv not in keys:
+                self.spectrum_items[key_cv].hide()
+        for key_cv, (frequencies, psd) in results.items():
+            if key_cv not in self.spectrum_items:
+                color = self.line_styles[key_cv]['pen']['color']
+                self.spectrum_items[key_cv] = self.spectrum_plot.plot(pen={'color': color, 'width': 1})
+            self.spectrum_items[key_cv].setData(frequencies[1:], psd[1:])
+            self.spectrum_items[key_cv].show()
+
+    def update_spectrogram(self, key_cv, image, frequencies):
+        # image rows are successive spectra; rows not filled yet are NaN
+        filled = np.isfinite(image)
+        if not filled.any():
+            return
+        image = np.where(filled, image, image[filled].min())
+        self.spectrogram_image.setImage(image.T, autoLevels=True)
+        self.spectrogram_image.setRect(qtc.QRectF(0, 0, frequencies[-1], image.shape[0]))
+        self.spectrogram_plot.setTitle(key_cv[:3])
+
+    def clear_spectrum(self):
+        if self.spectrum_window is None:
+            return
+        for key_cv in self.spectrum_items:
+            self.spectrum_plot.removeItem(self.spectrum_items[key_cv])
+        self.spectrum_items = {}
+        self.spectrogram_image.clear()
+        self.spectrogram_plot.setTitle(None)
+
+    def update_sparklines(self, detectors_arrays):
+        for key_cv in detectors_arrays:
+            if key_cv not in self.detector_list.rows:
+                continue
+            color = self.line_styles[key_cv]['pen']['color']
+            pixmap, changed = self.sparkline_cache.pixmap(key_cv, detectors_arrays[key_cv], color)
+            if changed:
+                self.detector_list.set_pixmap(key_cv, pixmap)
+
+    def clear_sparklines(self):
+        self.sparkline_cache.clear()
+        self.detector_list.clear_pixmaps()
+
     def vline_moved(self):
         v_min = self.vline_min.getXPos()
         v_max = self.vline_max.getXPos()
@@ -349,25 +624,16 @@ class PyQtView(qtw.QMainWindow):
         if not self.visible_plot_data_items == 1:
             return
         self.temporary_vline_override = False
-        for key_cb in self.dnncb:
-            if self.dnncb[key_cb].isChecked():
-                key_cv = key_cb.replace('B', 'V')
-                h_min = self.hline_min.getYPos()
-                h_max = self.hline_max.getYPos()
-                h_mid = (h_min + h_max) / 2.0
-                x_crossing_points = []
-                x_points = self.dnncv[key_cv].getData()[0]
-                y_points = self.dnncv[key_cv].getData()[1]
-                for i in range(x_points.size - 1):
-                    if y_points[i] < h_mid <= y_points[i + 1] or y_points[i + 1] < h_mid <= y_points[i]:
-                        y2, y1, x2, x1 = y_points[i + 1], y_points[i], x_points[i + 1], x_points[i]
-                        m = (y2 - y1) / (x2 - x1)
-                        x_crossing_point = (h_mid - y1) / m + x1
-                        x_crossing_points.append(x_crossing_point)
-                if len(x_crossing_points) > 1:
-                    self.vline_min.setValue(x_crossing_points[0])
-                    self.vline_max.setValue(x_crossing_points[-1])
-                break
+        for key_cv in self.visible_detector_keys():
+            h_min = self.hline_min.getYPos()
+            h_max = self.hline_max.getYPos()
+            h_mid = (h_min + h_max) / 2.0
+            x_points, y_points = self.dnncv[key_cv].getData()
+            x_crossing_points = crossings(x_points, y_points, h_mid)
+            if len(x_crossing_points) > 1:
+                self.vline_min.setValue(x_crossing_points[0])
+                self.vline_max.setValue(x_crossing_points[-1])
+            break
 
     def reset_horizontal_markers(self):
         if self.visible_plot_data_items == 0:
@@ -375,12 +641,10 @@ class PyQtView(qtw.QMainWindow):
         self.temporary_hline_override = False
         y_minimums = []
         y_maximums = []
-        for key_cb in self.dnncb:
-            if self.dnncb[key_cb].isChecked():
-                key_cv = key_cb.replace('B', 'V')
-                y_min, y_max = self.dnncv[key_cv].dataBounds(1)
-                y_minimums.append(y_min)
-                y_maximums.append(y_max)
+        for key_cv in self.visible_detector_keys():
+            y_min, y_max = self.dnncv[key_cv].dataBounds(1)
+            y_minimums.append(y_min)
+            y_maximums.append(y_max)
         try:
             data_y_min = min(y_minimums)
             data_y_max = max(y_maximums)
@@ -389,21 +653,92 @@ class PyQtView(qtw.QMainWindow):
         except TypeError:
             return
 
+    def set_horizontal_markers(self, y_min, y_max):
+        # used during a scan with bounds the controller keeps up to date point by point
+        if self.visible_plot_data_items == 0:
+            return
+        self.temporary_hline_override = False
+        self.hline_min.setValue(y_min)
+        self.hline_max.setValue(y_max)
+
     def reset_all_markers(self):
         self.reset_horizontal_markers()
         self.reset_vertical_markers()
 
-    def det_cbox_toggled(self):
+    def det_cbox_toggled(self, key_cv, checked):
+        # only the toggled channel and its overlays are added or removed
+        if key_cv not in self.dnncv:
+            return
         item_list = self.plot_window.listDataItems()
-        for key_cb in self.dnncb:
-            key_cv = key_cb.replace('B', 'V')
-            if self.dnncb[key_cb].isChecked() and self.dnncv[key_cv] not in item_list:
-                self.plot_window.addItem(self.dnncv[key_cv])
-                self.visible_plot_data_items += 1
-            elif not self.dnncb[key_cb].isChecked() and self.dnncv[key_cv] in item_list:
-                self.plot_window.removeItem(self.dnncv[key_cv])
-                self.visible_plot_data_items -= 1
+        if checked and self.dnncv[key_cv] not in item_list:
+            self.plot_window.addItem(self.dnncv[key_cv])
+            self.visible_plot_data_items += 1
+        elif not checked and self.dnncv[key_cv] in item_list:
+            self.plot_window.removeItem(self.dnncv[key_cv])
+            self.visible_plot_data_items -= 1
+        for overlay in self.overlay_items.get(key_cv, []):
+            if checked and overlay not in item_list:
+                self.plot_window.addItem(overlay)
+            elif not checked and overlay in item_list:
+                self.plot_window.removeItem(overlay)
         self.view_box.enableAutoRange(axis='y')
+        if self.is_shown(self.accumulate_window):
+            self.controller.show_accumulation()
+
+    def visible_detector_keys(self):
+        return self.detector_list.checked_keys()
+
+    def show_fit(self, key_cv, x_values, y_values):
+        if key_cv not in self.fit_items:
+            color = self.line_styles[key_cv]['pen']['color']
+            self.fit_items[key_cv] = pg.PlotDataItem(pen={'color': color, 'width': 1, 'style': qtc.Qt.DotLine})
+        if self.fit_items[key_cv] not in self.plot_window.listDataItems():
+            self.plot_window.addItem(self.fit_items[key_cv])
+        self.fit_items[key_cv].setData(x_values, y_values)
+
+    def show_fit_center(self, x_center):
+        self.fit_line.setValue(x_center)
+        self.fit_line.show()
+        self.fit_center_button.setText('%.3f' % x_center)
+
+    def clear_fits(self):
+        item_list = self.plot_window.listDataItems()
+        for key_cv in self.fit_items:
+            if self.fit_items[key_cv] in item_list:
+                self.plot_window.removeItem(self.fit_items[key_cv])
+        self.fit_line.hide()
+        self.fit_center_button.setText('')
+
+    def curve_bounds(self):
+        # y extent of each overlay and fit curve currently drawn on the plot
+        item_list = self.plot_window.listDataItems()
+        curves = [overlay for overlays in self.overlay_items.values() for overlay in overlays]
+        curves += list(self.fit_items.values())
+        found = []
+        for curve in curves:
+            if curve not in item_list:
+                continue
+            lo, hi = curve.dataBounds(1)
+            if lo is not None and np.isfinite(lo) and np.isfinite(hi):
+                found.append((lo, hi))
+        return found
+
+    def add_overlay(self, key_cv, x_values, y_values, label):
+        # overlays share the detector color but are drawn dashed without symbols
+        color = self.line_styles[key_cv]['pen']['color']
+        pen = {'color': color, 'width': 1, 'style': qtc.Qt.DashLine}
+        overlay = pg.PlotDataItem(x_values, y_values, name=label, pen=pen)
+        self.overlay_items.setdefault(key_cv, []).append(overlay)
+        if self.detector_list.is_checked(key_cv):
+            self.plot_window.addItem(overlay)
+
+    def clear_overlays(self):
+        item_list = self.plot_window.listDataItems()
+        for key_cv in self.overlay_items:
+            for overlay in self.overlay_items[key_cv]:
+                if overlay in item_list:
+                    self.plot_window.removeItem(overlay)
+        self.overlay_items = {}
 
     def clear_plots(self):
         for each in self.dnncv:
@@ -420,6 +755,7 @@ class PyQtView(qtw.QMainWindow):
         self.hline_max.setValue(y_max)
 
     def test_button_clicked(self):
+        from epics import caget
         short_path = caget('16test:saveData_fullPathName', as_string=True)
         print(short_path)
         fs = caget('16test:saveData_fileSystem')
@@ -435,5 +771,6 @@ if __name__ == '__main__':
     app = qtw.QApplication(sys.argv)
     controller = None
     gui = PyQtView(controller)
+    gui.build_detectors_control()
     gui.show()
     sys.exit(app.exec_())
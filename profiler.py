@@ -0,0 +1,75 @@
+import os
+import sys
+import time
+import threading
+from collections import Counter
+
+'''
+Sampling profiler for field diagnosis
+
+A daemon thread wakes every SAMPLE_INTERVAL seconds, reads the current stack
+of every Python thread (Qt main loop, acquisition thread, pyepics CA
+callback threads, worker pools) from sys._current_frames() and counts each
+distinct stack.  Nothing is hooked into the profiled code, so overhead is
+one stack walk per thread per sample.  The output is the "collapsed" format
+read by flamegraph.pl and speedscope: one "thread;outer;...;inner count"
+line per stack.
+'''
+
+SAMPLE_INTERVAL = 0.005
+
+
+def frame_label(frame):
+    code = frame.f_code
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+class SamplingProfiler:
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.samples = Counter()
+        self.num_samples = 0
+        self.started = None
+        self.thread = None
+        self.stop_event = threading.Event()
+
+    @property
+    def running(self):
+        return self.thread is not None
+
+    def start(self):
+        if self.running:
+            return
+        self.samples = Counter()
+        self.num_samples = 0
+        self.started = time.time()
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, name='oculus-profiler', daemon=True)
+        self.thread.start()
+
+    def run(self):
+        own_ident = threading.get_ident()
+        while not self.stop_event.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(frame_label(frame))
+                    frame = frame.f_back
+                stack.append(names.get(ident, f'thread-{ident}'))
+                self.samples[';'.join(reversed(stack))] += 1
+            self.num_samples += 1
+
+    def stop(self, path):
+        """Stop sampling and write the collapsed stacks to path."""
+        if not self.running:
+            return None
+        self.stop_event.set()
+        self.thread.join()
+        self.thread = None
+        with open(path, 'w') as f:
+            for stack, count in self.samples.most_common():
+                f.write(f'{stack} {count}\n')
+        return path
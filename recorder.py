@@ -0,0 +1,220 @@
+import os
+import sys
+import json
+import time
+import socket
+import signal
+import argparse
+import threading
+import numpy as np
+from scan_core import ScanCore
+from scan_export import export_columns
+
+'''
+Headless recording daemon
+
+Watches one or more scan records of an IOC and streams every point into a
+local columnar store, without Qt or a display:
+
+    python recorder.py 16test: scan1. scan2. scanH.
+
+Each scan record gets its own ScanCore and acquisition thread.  Every scan
+becomes one directory under STORE_DIR/<trunk>/ holding one raw binary file
+per channel (positioners, detectors and the TSPOS/TSDET/TSVAL timestamps),
+appended as points arrive, and scan.json with the scan metadata and the
+dtype of each column.  read_scan() memory-maps a scan back, including one
+still being recorded.
+'''
+
+STORE_DIR = os.path.join(os.path.expanduser('~'), '.oculus3', 'store')
+METADATA_FILE = 'scan.json'
+POSITIONER_FIELDS = ('PV', 'SP', 'EP', 'SI', 'CP', 'WD', 'SM', 'AR')
+
+
+def plain(value):
+    # numpy scalars as python values, so the metadata stays plain JSON
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def snapshot_columns(snapshot):
+    keys, names, arrays = export_columns(snapshot)
+    for key, values in snapshot.timing_arrays.items():
+        keys.append(key)
+        names.append(key)
+        arrays.append(values)
+    return keys, names, arrays
+
+
+class ColumnStore:
+    def __init__(self, path, metadata):
+        self.path = path
+        self.metadata = dict(metadata, columns={}, num_points=0, finished=None)
+        self.num_points = 0
+        self.files = {}
+        os.makedirs(path, exist_ok=True)
+        self.write_metadata()
+
+    def write_metadata(self):
+        # written aside and renamed, so a reader never sees half a file
+        metadata_path = os.path.join(self.path, METADATA_FILE)
+        with open(metadata_path + '.tmp', 'w') as f:
+            json.dump(self.metadata, f, indent=1, default=str)
+        os.replace(metadata_path + '.tmp', metadata_path)
+
+    def append(self, keys, names, arrays, num_points, rewrite=False):
+        """Write points from the last stored one up to num_points (every point if rewrite)."""
+        layout_changed = False
+        for key, name, values in zip(keys, names, arrays):
+            start = 0 if rewrite else min(self.num_points, num_points)
+            column = self.metadata['columns'].get(key)
+            if column is None or column['dtype'] != values.dtype.str:
+                # a new channel, or one whose buffer type changed, is written out whole
+                self.metadata['columns'][key] = {'name': name, 'dtype': values.dtype.str}
+                layout_changed = True
+                start = 0
+            if key not in self.files:
+                self.files[key] = open(os.path.join(self.path, key + '.bin'), 'w+b')
+            f = self.files[key]
+            if start == 0:
+                f.seek(0)
+                f.truncate()
+            else:
+                f.seek(start * values.itemsize)
+            values[start:num_points].tofile(f)
+            f.flush()
+        self.num_points = num_points
+        if layout_changed:
+            self.write_metadata()
+
+    def finish(self, keys, names, arrays, num_points, metadata):
+        # the final arrays are written in full, covering points backfilled after they were streamed
+        self.append(keys, names, arrays, num_points, rewrite=True)
+        self.metadata.update(metadata, num_points=num_points)
+        self.write_metadata()
+        self.close()
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        self.files = {}
+
+
+def read_scan(path):
+    """Return (metadata, {key: memory-mapped column}) for a recorded scan."""
+    with open(os.path.join(path, METADATA_FILE)) as f:
+        metadata = json.load(f)
+    arrays = {}
+    for key, column in metadata['columns'].items():
+        dtype = np.dtype(column['dtype'])
+        column_path = os.path.join(path, key + '.bin')
+        # a scan still being recorded is read up to its last complete point
+        size = os.path.getsize(column_path) // dtype.itemsize
+        if metadata['finished'] is not None:
+            size = min(size, metadata['num_points'])
+        arrays[key] = np.memmap(column_path, dtype=dtype, mode='r', shape=(size,)) if size else np.zeros(0, dtype)
+    return metadata, arrays
+
+
+class ScanRecorder(ScanCore):
+    def __init__(self, root, stump, store_dir=STORE_DIR):
+        self.store_dir = store_dir
+        self.store = None
+        super().__init__(root, stump)
+
+    # the store is this process's record; the journal belongs to a GUI on the same host
+    def open_journal(self):
+        self.journal = None
+
+    def reattach_journal(self):
+        pass
+
+    def scan_metadata(self, snapshot):
+        positioners = {}
+        for key in snapshot.positioners_arrays:
+            n = key[1]
+            positioners[f'P{n}'] = {a: plain(self.pnpv[f'P{n}{a}'].value) for a in POSITIONER_FIELDS}
+        return {'host': socket.gethostname(),
+                'trunk': self.trunk,
+                'scan_file': self.file_name_display.value,
+                'file_path': self.file_path_display.value,
+                'requested_points': plain(self.npts.value),
+                'started': time.time(),
+                'positioners': positioners,
+                'names': dict(snapshot.positioners_names, **snapshot.detectors_names)}
+
+    def open_store(self, snapshot):
+        metadata = self.scan_metadata(snapshot)
+        stem = os.path.splitext(metadata['scan_file'] or '')[0] or 'scan'
+        name = time.strftime('%Y%m%d-%H%M%S', time.localtime(metadata['started'])) + '_' + stem
+        path = os.path.join(self.store_dir, self.trunk.replace(':', '_').rstrip('.'), name)
+        try:
+            self.store = ColumnStore(path, metadata)
+        except OSError as error:
+            self.report_status(f'could not open store for {self.trunk}: {error}')
+            self.store = None
+
+    def snapshot_ready(self, snapshot):
+        if self.store is None and snapshot.scanning and snapshot.num_points:
+            # started during a scan: record it from the backfilled points on
+            self.open_store(snapshot)
+        if self.store is None:
+            return
+        try:
+            self.store.append(*snapshot_columns(snapshot), snapshot.num_points)
+        except OSError as error:
+            self.report_status(f'could not write points of {self.trunk}: {error}')
+
+    def scan_state_changed(self, value):
+        if value == 0:
+            if self.store is not None:
+                # the previous scan never reported its end; keep what it has
+                self.store.close()
+            self.open_store(self.latest_snapshot)
+        elif self.store is not None:
+            snapshot = self.latest_snapshot
+            try:
+                self.store.finish(*snapshot_columns(snapshot), snapshot.num_points,
+                                  {'finished': time.time(),
+                                   'names': dict(snapshot.positioners_names, **snapshot.detectors_names)})
+                self.report_status(f'recorded {snapshot.num_points} points of {self.trunk} in {self.store.path}')
+            except OSError as error:
+                self.report_status(f'could not finish store for {self.trunk}: {error}')
+            self.store = None
+
+    def report_status(self, message):
+        print(time.strftime('%Y-%m-%d %H:%M:%S'), message, flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Record every point of one or more scan records, without a GUI.')
+    parser.add_argument('root', help="IOC prefix, e.g. '16test:'")
+    parser.add_argument('stumps', nargs='+', help="scan records, e.g. 'scan1.' 'scan2.'")
+    parser.add_argument('--store', default=STORE_DIR, help='directory of the columnar store')
+    args = parser.parse_args(argv)
+
+    # note that each stump should end in a dot (e.g., 'scan1.')
+    recorders = [ScanRecorder(args.root, stump if stump.endswith('.') else stump + '.', args.store)
+                 for stump in args.stumps]
+    threads = [threading.Thread(target=recorder.run, name=f'record-{recorder.trunk}', daemon=True)
+               for recorder in recorders]
+    for thread in threads:
+        thread.start()
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *args: stop.set())
+    signal.signal(signal.SIGINT, lambda *args: stop.set())
+    print(f'recording {", ".join(recorder.trunk for recorder in recorders)} into {args.store}', flush=True)
+    stop.wait()
+
+    for recorder in recorders:
+        recorder.stop()
+    for thread in threads:
+        thread.join()
+    for recorder in recorders:
+        if recorder.store is not None:
+            recorder.store.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
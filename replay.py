@@ -0,0 +1,128 @@
+import os
+import time
+import numpy as np
+from PyQt5 import QtCore as qtc
+import constants
+from oculus3_v0_core import CoreData
+from mda_cache import load_archived_scan
+
+'''
+Replay of a recorded MDA scan through the live pipeline
+
+ReplayCoreData is a CoreData whose PVs are plain values filled from an
+archived scan.  Playback sets CPT and the RnCV/DnnCV values for each point
+and then calls the same val_triggered/data_triggered callbacks the IOC
+would, so record_point, publish_snapshot and the controller all run exactly
+as they do during beamtime.
+'''
+
+
+class ReplayValue:
+    # stands in for a PV: a value, plus the few PV methods CoreData calls
+    def __init__(self, value=None):
+        self.value = value
+        self.timestamp = None
+
+    def get(self, **kwargs):
+        return self.value
+
+    def wait_for_connection(self, **kwargs):
+        return True
+
+    def add_callback(self, *args, **kwargs):
+        return None
+
+
+class ReplayCoreData(CoreData):
+    def __init__(self, fname, points_per_second=0):
+        # points_per_second of 0 replays as fast as the event loop allows
+        self.scan = load_archived_scan(fname)
+        self.points_per_second = points_per_second
+        self.replay_index = 0
+        super().__init__('replay:', 'scan1.')
+
+        self.replay_timer = qtc.QTimer(self)
+        self.replay_timer.setInterval(int(1000 / points_per_second) if points_per_second > 0 else 0)
+        self.replay_timer.timeout.connect(self.replay_next_point)
+
+    def create_pvs(self):
+        scan = self.scan
+        for i in range(1, constants.NUM_POSITIONERS + 1):
+            for a in CoreData.pos_attrs:
+                self.pnpv['P%i%s' % (i, a)] = ReplayValue(0)
+            key_rncv = 'R%iCV' % i
+            self.rncv[key_rncv] = ReplayValue(0.0)
+            recorded = key_rncv in scan.arrays
+            self.pnpv['P%iPV' % i].value = scan.names[key_rncv] if recorded else ''
+            self.pnpv['P%iNV' % i].value = 0 if recorded else 1
+            if recorded:
+                x_values = scan.arrays[key_rncv]
+                self.pnpv['P%iSP' % i].value = x_values[0] if scan.num_points else 0
+                self.pnpv['P%iEP' % i].value = x_values[-1] if scan.num_points else 0
+                self.pnpv['P%iRA' % i].value = np.array(x_values)
+
+        for i in range(1, constants.NUM_DETECTORS + 1):
+            key_cv = 'D%2.2iCV' % i
+            recorded = key_cv in scan.arrays
+            self.dnnpv['D%2.2iPV' % i] = ReplayValue(scan.names[key_cv] if recorded else '')
+            self.dnnnv['D%2.2iNV' % i] = ReplayValue(0 if recorded else 1)
+            self.dnncv[key_cv] = ReplayValue(0.0)
+            self.dnnda['D%2.2iDA' % i] = ReplayValue(np.array(scan.arrays[key_cv]) if recorded else None)
+
+        head, tail = os.path.split(os.path.abspath(scan.fname))
+        self.file_path_fs = ReplayValue(head)
+        self.file_path_sd = ReplayValue('')
+        self.file_path_display = ReplayValue(head)
+        self.file_name_display = ReplayValue(tail)
+
+        self.val = ReplayValue(0)
+        self.data = ReplayValue(1)
+        self.cpt = ReplayValue(0)
+        self.npts = ReplayValue(scan.num_points)
+
+        # full names answered by fetch_many in place of the IOC
+        self.replay_values = {}
+        for values in (self.pnpv, self.dnnpv, self.dnnnv, self.dnnda):
+            for key in values:
+                self.replay_values[self.trunk + key] = values[key].value
+
+    def add_callbacks(self):
+        # playback calls the callbacks directly
+        pass
+
+    def fetch_many(self, pvnames, **kwargs):
+        return [self.replay_values.get(name) for name in pvnames]
+
+    def fetch_dtypes(self, pvnames):
+        return [np.float64] * len(pvnames)
+
+    def open_journal(self):
+        # a replay is reproducible from its file and must not touch the live journal
+        self.journal = None
+
+    def start_acquisition(self):
+        self.replay_index = 0
+        self.cpt.value = 0
+        self.data.value = 0
+        self.data_triggered(value=0)
+        self.replay_timer.start()
+
+    def replay_next_point(self):
+        i = self.replay_index
+        if i >= self.scan.num_points:
+            self.replay_timer.stop()
+            self.data.value = 1
+            self.data_triggered(value=1)
+            return
+        now = time.time()
+        for key in self.rncv:
+            if key in self.scan.arrays:
+                self.rncv[key].value = self.scan.arrays[key][i]
+                self.rncv[key].timestamp = now
+        for key in self.dnncv:
+            if key in self.scan.arrays:
+                self.dnncv[key].value = self.scan.arrays[key][i]
+                self.dnncv[key].timestamp = now
+        self.cpt.value = i + 1
+        self.replay_index = i + 1
+        self.val_triggered()
@@ -0,0 +1,110 @@
+import time
+import threading
+import numpy as np
+
+'''
+Fixed-size time series of monitor updates
+
+SampleRing keeps the last `capacity` (timestamp, value) pairs of one channel
+in two preallocated arrays; appending is two stores under a lock, so it is
+cheap enough to run in the CA callback itself, at the full monitor rate.
+Readers copy out the latest samples, or the samples added since a total
+count they remember, so memory and read cost never depend on how long the
+channel has been recorded.
+
+ChannelMonitor attaches such rings to PVs through extra monitor callbacks.
+'''
+
+
+class SampleRing:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.times = np.full(capacity, np.nan)
+        self.values = np.full(capacity, np.nan)
+        # total number of samples ever appended
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def append(self, timestamp, value):
+        with self.lock:
+            i = self.count % self.capacity
+            self.times[i] = timestamp
+            self.values[i] = value
+            self.count += 1
+
+    def clear(self):
+        with self.lock:
+            self.count = 0
+
+    def latest(self, n=None):
+        """Return copies of the last n samples (all if None), oldest first."""
+        with self.lock:
+            return self.copy_range(max(self.count - min(n or self.capacity, len(self)), 0), self.count)
+
+    def since(self, count):
+        """Return (times, values, new count) for the samples appended after count."""
+        with self.lock:
+            start = max(count, self.count - self.capacity)
+            times, values = self.copy_range(start, self.count)
+            return times, values, self.count
+
+    def copy_range(self, start, stop):
+        # start/stop are total counts; the slice may wrap around the end of the arrays
+        i, j = start % self.capacity, stop % self.capacity
+        if stop - start == 0:
+            return np.empty(0), np.empty(0)
+        if i < j:
+            return self.times[i:j].copy(), self.values[i:j].copy()
+        return np.concatenate([self.times[i:], self.times[:j]]), np.concatenate([self.values[i:], self.values[:j]])
+
+
+class ChannelMonitor:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.rings = {}
+        self.callbacks = {}
+
+    def watch(self, key, pv):
+        if key in self.rings:
+            return self.rings[key]
+        ring = SampleRing(self.capacity)
+        add_callback = getattr(pv, 'add_callback', None)
+        if add_callback is None:
+            # stand-ins without monitors (e.g. fan-out clients) give an empty ring
+            self.rings[key] = ring
+            return ring
+
+        def sample(value=None, timestamp=None, **kwargs):
+            # runs on a CA thread
+            try:
+                ring.append(timestamp or time.time(), float(value))
+            except (TypeError, ValueError):
+                pass
+
+        self.rings[key] = ring
+        index = add_callback(sample)
+        if index is not None:
+            self.callbacks[key] = (pv, index)
+        return ring
+
+    def unwatch(self, key):
+        self.rings.pop(key, None)
+        if key in self.callbacks:
+            pv, index = self.callbacks.pop(key)
+            pv.remove_callback(index)
+
+    def unwatch_all(self):
+        for key in list(self.rings):
+            self.unwatch(key)
+
+    def follow(self, pvs, keys):
+        """Watch exactly keys (looked up in pvs), dropping any other channel."""
+        for key in list(self.rings):
+            if key not in keys:
+                self.unwatch(key)
+        for key in keys:
+            if key in pvs:
+                self.watch(key, pvs[key])
@@ -0,0 +1,627 @@
+import os
+import time
+import queue
+import traceback
+import numpy as np
+from collections import namedtuple
+from epics import PV, caget_many, ca
+import constants
+from scan_journal import ScanJournal, journal_path
+from virtual_channels import VirtualChannels
+from scan_timing import TIMING_KEYS
+
+'''
+Qt-free acquisition model of one scan record
+
+ScanCore holds everything CoreData does (PVs, active channel buffers,
+batched resolution, journal, backfill, connection supervision, snapshots)
+without Qt.  CA callbacks never touch the buffers themselves: they post the
+matching handler to an event queue, and one thread works through it in
+run(), resolving changed channels whenever the queue drains.  Results leave
+through three hooks a subclass overrides:
+    snapshot_ready(snapshot)    after every published snapshot
+    scan_state_changed(value)   when DATA goes to 0 (scan start) or 1 (finish)
+    report_status(message)      connection loss and recovery
+CoreData routes these through Qt signals for the GUI; recorder.py uses them
+headless.
+'''
+
+
+# compact buffer type for each native CA field type; anything else stays float64
+# (DBF_SHORT, DBF_FLOAT, DBF_ENUM, DBF_CHAR, DBF_LONG)
+NATIVE_DTYPES = {1: np.int16, 2: np.float32, 3: np.uint16, 4: np.uint8, 5: np.int32}
+
+
+def native_dtypes(pvnames, timeout=1.0):
+    # create every channel first, then wait once for the whole batch; no value transfer
+    chids = [ca.create_channel(name, connect=False, auto_cb=False) for name in pvnames]
+    started = time.time()
+    while not all(ca.isConnected(chid) for chid in chids) and time.time() - started < timeout:
+        ca.poll(evt=0.01)
+    # unreachable fields fall back to float64
+    return [NATIVE_DTYPES.get(ca.field_type(chid), np.float64) if ca.isConnected(chid) else np.float64
+            for chid in chids]
+
+
+# read-only view of the acquisition state handed from the worker thread to the view
+# first_changed is the first point that may differ from the previous snapshot
+ScanSnapshot = namedtuple('ScanSnapshot', ['version', 'num_points', 'scanning',
+                                           'positioners_arrays', 'positioners_names',
+                                           'detectors_arrays', 'detectors_names',
+                                           'timing_arrays', 'first_changed'])
+
+
+class ScanCore:
+    # class attributes to build the positioner dictionary pnpv, including:
+    # pv, name, p0, min, center, max, step, width, scan mode, abs/rel, and readback array
+    pos_attrs = ('PV', 'NV', 'PP', 'SP', 'CP', 'EP', 'SI', 'WD', 'SM', 'AR', 'RA')
+
+    # how long the supervisor waits for every channel to come back after a reconnect
+    RECONNECT_TIMEOUT = 5.0
+
+    # a burst of PnPV/DnnPV changes (e.g. a configuration restore) is resolved in one pass once
+    # it has been quiet for RECONFIGURE_WINDOW seconds, and RECONFIGURE_MAX_DELAY after its start at the latest
+    RECONFIGURE_WINDOW = 0.1
+    RECONFIGURE_MAX_DELAY = 1.0
+
+    def __init__(self, root, stump):
+        # handlers posted by CA callbacks, worked through in order by run()
+        self.events = queue.Queue()
+        self.running = False
+
+        '''
+        create empty core data dictionaries, including:
+        
+        Several positioner PVs (see class pos_attrs)
+        Readback current value
+        
+        Detector PVs
+        Name valids
+        Current values
+        Final data arrays
+        '''
+
+        self.pnpv = {}
+        self.rncv = {}
+
+        self.dnnpv = {}
+        self.dnnnv = {}
+        self.dnncv = {}
+        self.dnnda = {}
+
+        '''
+        Create dictionaries to hold the real-time scan results (np.arrays)
+        and names for active positioners and detectors
+        '''
+
+        self.active_positioners_arrays = {}
+        self.active_positioners_names = {}
+        self.active_detectors_arrays = {}
+        self.active_detectors_names = {}
+
+        # buffer dtype of each active detector, from the native type of its source field
+        self.channel_dtypes = {}
+
+        # CA timestamps of every point (see scan_timing), NaN where unknown
+        self.timing_arrays = {key: np.full(constants.MAX_NUM_POINTS, np.nan) for key in TIMING_KEYS}
+
+        # combine ioc prefix with scan number to generate PV trunk
+        # note that stump should end in a dot (e.g., 'scan1.')
+        self.root = root
+        self.stump = stump
+        self.trunk = root + stump
+
+        # create all scan record and file management PVs
+        self.create_pvs()
+
+        # flags to indicate if positioners, detectors, path have been modified
+        self.positioners_modified_flag = True
+        self.detectors_modified_flag = True
+
+        # snapshots are versioned so the view can skip any that are already stale
+        self.num_points = 0
+        self.snapshot_version = 0
+        self.latest_snapshot = None
+        # points of the current buffers that published snapshots still look at
+        self.published_points = 0
+        # lowest point written since the last publish, for first_changed
+        self.first_changed = 0
+
+        # memory-mapped journal of the scan in progress (see scan_journal)
+        self.journal = None
+
+        # user-defined expression channels, published alongside the detectors
+        self.virtual_channels = VirtualChannels()
+
+        # channels whose PnPV/DnnPV changed, resolved in one batch by resolve_pending
+        self.pending_positioners = set()
+        self.pending_detectors = set()
+        self.pending_since = None
+        self.resolve_deadline = None
+
+        # connection supervisor state, see supervise_connection
+        self.ioc_connected = True
+        self.disconnect_time = None
+
+        # fill active positioner and detector arrays on program start
+        self.initialize_active_positioners()
+        self.initialize_active_detectors()
+        self.resolve_pending()
+
+        self.add_callbacks()
+
+        # pick up points journaled by an earlier Oculus session of the running scan
+        self.reattach_journal()
+
+    def create_pvs(self):
+        # create Positioner PVs and add to existing dictionaries
+        for i in range(1, constants.NUM_POSITIONERS + 1):
+            for a in ScanCore.pos_attrs:
+                key_pnpv = 'P%i%s' % (i, a)
+                self.pnpv[key_pnpv] = PV(self.trunk + key_pnpv)
+                if a == 'PV':
+                    self.pnpv[key_pnpv].wait_for_connection()
+                    self.pnpv[key_pnpv].add_callback(self.positioners_modified)
+            key_rncv = 'R%iCV' % i
+            self.rncv[key_rncv] = PV(self.trunk + key_rncv)
+
+        # create detector PVs and add to existing dictionaries
+        for i in range(1, constants.NUM_DETECTORS + 1):
+            key_pv = 'D%2.2iPV' % i
+            key_nv = 'D%2.2iNV' % i
+            key_cv = 'D%2.2iCV' % i
+            key_da = 'D%2.2iDA' % i
+            self.dnnpv[key_pv] = PV(self.trunk + key_pv)
+            self.dnnnv[key_nv] = PV(self.trunk + key_nv)
+            self.dnncv[key_cv] = PV(self.trunk + key_cv)
+            self.dnnda[key_da] = PV(self.trunk + key_da)
+            # add callback to DnnPV (after connection is established)
+            self.dnnpv[key_pv].wait_for_connection()
+            self.dnnpv[key_pv].add_callback(self.detectors_modified)
+
+        # create saveData PVs for file management
+        self.file_path_fs = PV(self.root + 'saveData_fileSystem')
+        self.file_path_sd = PV(self.root + 'saveData_subDir')
+        self.file_path_display = PV(self.root + 'saveData_fullPathName')
+        self.file_name_display = PV(self.root + 'saveData_fileName')
+
+        # create real-time scan activity PVs
+        self.val = PV(self.trunk + 'VAL')
+        self.data = PV(self.trunk + 'DATA')
+        self.cpt = PV(self.trunk + 'CPT')
+        self.npts = PV(self.trunk + 'NPTS')
+
+    def add_callbacks(self):
+        # add callbacks (after connection is established)
+        self.val.wait_for_connection()
+        self.val.add_callback(self.val_triggered)
+        self.data.wait_for_connection()
+        self.data.add_callback(self.data_triggered)
+        # DATA lives on the scan record, so its connection stands for the whole IOC
+        self.data.connection_callbacks.append(self.data_connection_changed)
+
+    # CA access used by the batched resolution, kept separate so replay can stand in for the IOC
+    def fetch_many(self, pvnames, **kwargs):
+        return caget_many(pvnames, **kwargs)
+
+    def fetch_dtypes(self, pvnames):
+        return native_dtypes(pvnames)
+
+    # EPICS callbacks, run on CA threads: hand the work to the acquisition thread
+    def val_triggered(self, timestamp=None, **kwargs):
+        self.post(self.record_point, timestamp or time.time())
+
+    def data_triggered(self, value, **kwargs):
+        self.post(self.start_stop_scan, value)
+
+    def data_connection_changed(self, conn=False, **kwargs):
+        self.post(self.supervise_connection, bool(conn))
+
+    # the modified flags are only raised by resolve_pending, once per burst
+    def positioners_modified(self, pvname, **kwargs):
+        self.post(self.update_active_positioner, pvname)
+
+    def detectors_modified(self, pvname, **kwargs):
+        self.post(self.update_active_detector, pvname)
+
+    # event loop, replaced by the Qt event loop in CoreData
+    def post(self, handler, *args):
+        self.events.put((handler, args))
+
+    def resolve_delay(self):
+        # each change restarts the window, up to the maximum delay after the first one
+        now = time.monotonic()
+        if self.pending_since is None:
+            self.pending_since = now
+        return max(0.0, min(self.RECONFIGURE_WINDOW, self.pending_since + self.RECONFIGURE_MAX_DELAY - now))
+
+    def schedule_resolve(self):
+        self.resolve_deadline = time.monotonic() + self.resolve_delay()
+
+    def run(self):
+        """Work through posted events until stop() is called."""
+        self.running = True
+        self.start_acquisition()
+        while self.running:
+            timeout = 0.5 if self.resolve_deadline is None else max(self.resolve_deadline - time.monotonic(), 0.0)
+            try:
+                handler, args = self.events.get(timeout=timeout)
+            except queue.Empty:
+                pass
+            else:
+                self.dispatch(handler, args)
+            if self.resolve_deadline is not None and time.monotonic() >= self.resolve_deadline:
+                self.dispatch(self.resolve_pending, ())
+
+    def dispatch(self, handler, args):
+        # one bad event (e.g. an array of the wrong length) must not end the event loop
+        try:
+            handler(*args)
+        except Exception as error:
+            traceback.print_exc()
+            self.report_status(f'error in {getattr(handler, "__name__", handler)}: {error!r}')
+
+    def stop(self):
+        self.running = False
+        self.post(lambda: None)
+
+    # hooks for whatever consumes the model
+    def snapshot_ready(self, snapshot):
+        pass
+
+    def scan_state_changed(self, value):
+        pass
+
+    def report_status(self, message):
+        print(message)
+
+    # acquisition thread slots
+    def start_acquisition(self):
+        self.attach_ca_context()
+        self.backfill_running_scan()
+
+    def attach_ca_context(self):
+        # CA calls from the acquisition thread must share the pyepics context
+        ca.use_initial_context()
+
+    def record_point(self, timestamp):
+        current_index = self.cpt.get(use_monitor=False) - 1
+        if not 0 <= current_index < constants.MAX_NUM_POINTS:
+            return
+        # a repeated or rewound CPT rewrites a point that is already published
+        self.detach_buffers(current_index)
+        t_pos = t_det = np.nan
+        for positioners in self.active_positioners_arrays:
+            self.active_positioners_arrays[positioners][current_index] = self.rncv[positioners].value
+            t_pos = np.fmax(t_pos, self.rncv[positioners].timestamp or np.nan)
+        for detectors in self.active_detectors_arrays:
+            self.active_detectors_arrays[detectors][current_index] = self.dnncv[detectors].value
+            t_det = np.fmax(t_det, self.dnncv[detectors].timestamp or np.nan)
+        self.timing_arrays['TSPOS'][current_index] = t_pos
+        self.timing_arrays['TSDET'][current_index] = t_det
+        self.timing_arrays['TSVAL'][current_index] = timestamp
+        # points queued behind a backfill must not shrink the published range
+        self.num_points = max(self.num_points, current_index + 1)
+        if self.journal is not None:
+            self.journal.append(current_index, [self.channel_value(key, current_index) for key in self.journal.keys])
+        self.publish_snapshot()
+
+    def start_stop_scan(self, value):
+        if value == 0:
+            self.reset_scan_buffers()
+            self.open_journal()
+        else:
+            self.num_points = self.cpt.value
+            if self.journal is not None:
+                self.journal.finish()
+                self.journal = None
+        self.publish_snapshot()
+        self.scan_state_changed(value)
+
+    def reset_scan_buffers(self):
+        # new arrays rather than zeroed ones, so earlier snapshots keep their data
+        self.num_points = 0
+        self.published_points = 0
+        self.first_changed = 0
+        for positioners in self.active_positioners_arrays:
+            self.active_positioners_arrays[positioners] = np.zeros(constants.MAX_NUM_POINTS)
+        for detectors in self.active_detectors_arrays:
+            self.active_detectors_arrays[detectors] = np.zeros(constants.MAX_NUM_POINTS,
+                                                               self.channel_dtypes.get(detectors, np.float64))
+        self.virtual_channels.reset()
+        self.timing_arrays = {key: np.full(constants.MAX_NUM_POINTS, np.nan) for key in TIMING_KEYS}
+
+    def add_virtual_channel(self, expression):
+        try:
+            self.virtual_channels.add(expression)
+        except ValueError as error:
+            print('virtual channel not added:', error)
+            return
+        self.detectors_modified_flag = True
+        self.publish_snapshot()
+
+    def clear_virtual_channels(self):
+        self.virtual_channels.clear()
+        self.detectors_modified_flag = True
+        self.publish_snapshot()
+
+    def all_pvs(self):
+        pvs = [self.val, self.data, self.cpt, self.npts]
+        for channels in (self.pnpv, self.rncv, self.dnnpv, self.dnnnv, self.dnncv):
+            pvs.extend(channels.values())
+        return pvs
+
+    def supervise_connection(self, connected):
+        """Bring the whole model back after the IOC drops and returns.
+
+        CA reconnects every channel on its own once the IOC is back; this waits
+        for all of them together, then refreshes validity and names for every
+        positioner and detector in one batched pass and backfills a running scan.
+        """
+        if not connected:
+            if self.ioc_connected:
+                self.ioc_connected = False
+                self.disconnect_time = time.time()
+                self.report_status(f'lost connection to {self.trunk}, waiting for the IOC')
+            return
+        if self.ioc_connected:
+            return
+        started = time.time()
+        pvs = self.all_pvs()
+        while not all(pv.connected for pv in pvs) and time.time() - started < self.RECONNECT_TIMEOUT:
+            ca.poll(evt=0.01)
+        missing = sum(not pv.connected for pv in pvs)
+        self.initialize_active_positioners()
+        self.initialize_active_detectors()
+        self.resolve_pending()
+        self.backfill_running_scan()
+        self.ioc_connected = True
+        recovery = time.time() - started
+        outage = started - self.disconnect_time if self.disconnect_time else 0.0
+        message = f'reconnected to {self.trunk} after {outage:.1f} s, recovered in {recovery:.2f} s'
+        if missing:
+            message += f' ({missing} channels still disconnected)'
+        self.report_status(message)
+
+    def backfill_running_scan(self):
+        """Fill the buffers with the points a running scan took before Oculus started.
+
+        VAL callbacks are already live, so any point after the CPT read here is
+        recorded normally; buffers are written by index, so overlaps are harmless.
+        """
+        if self.data.get(use_monitor=False) != 0:
+            return
+        num_points = min(self.cpt.get(use_monitor=False) or 0, constants.MAX_NUM_POINTS)
+        if num_points == 0:
+            return
+        keys = list(self.active_positioners_arrays) + list(self.active_detectors_arrays)
+        # R1CV -> P1RA, D01CV -> D01DA, fetched together in one round-trip
+        array_names = [self.trunk + ('P%sRA' % key[1] if key[0] == 'R' else key[:3] + 'DA') for key in keys]
+        values = self.fetch_many(array_names, count=num_points)
+        self.detach_buffers(0)
+        for key, value in zip(keys, values):
+            if value is None:
+                continue
+            value = np.atleast_1d(value)[:num_points]
+            if key in self.active_positioners_arrays:
+                self.active_positioners_arrays[key][:len(value)] = value
+            else:
+                self.active_detectors_arrays[key][:len(value)] = value
+        self.num_points = max(self.num_points, num_points)
+        if self.journal is None:
+            self.open_journal()
+            if self.journal is not None:
+                for index in range(self.num_points):
+                    self.journal.append(index, [self.channel_value(key, index) for key in self.journal.keys])
+        self.publish_snapshot()
+
+    def channel_value(self, key, index):
+        if key in self.active_positioners_arrays:
+            return self.active_positioners_arrays[key][index]
+        if key in self.active_detectors_arrays:
+            return self.active_detectors_arrays[key][index]
+        return np.nan
+
+    def open_journal(self):
+        if self.journal is not None:
+            self.journal.close()
+        keys = list(self.active_positioners_arrays) + list(self.active_detectors_arrays)
+        try:
+            self.journal = ScanJournal.create(journal_path(self.trunk), self.trunk, self.file_name_display.value,
+                                              keys, constants.MAX_NUM_POINTS)
+        except (OSError, ValueError):
+            print('could not open scan journal')
+            self.journal = None
+
+    def reattach_journal(self):
+        path = journal_path(self.trunk)
+        if self.data.value != 0 or not os.path.isfile(path):
+            return
+        try:
+            journal = ScanJournal.open(path)
+        except (OSError, ValueError):
+            return
+        # only reattach to the scan that is actually running now
+        if not journal.running or journal.layout['scan_file'] != self.file_name_display.value:
+            journal.close()
+            return
+        num_points = min(journal.num_points, constants.MAX_NUM_POINTS)
+        self.detach_buffers(0)
+        for key in journal.keys:
+            if key in self.active_positioners_arrays:
+                self.active_positioners_arrays[key][:num_points] = journal.channel(key)[:num_points]
+            elif key in self.active_detectors_arrays:
+                self.active_detectors_arrays[key][:num_points] = journal.channel(key)[:num_points]
+        self.num_points = num_points
+        self.journal = journal
+        self.publish_snapshot()
+
+    def detach_buffers(self, start):
+        """Give the buffers new copies before points from start on are rewritten.
+
+        Only needed when start falls inside what has been published; the
+        copies are not shared with any snapshot until the next publish.
+        """
+        self.first_changed = min(self.first_changed, start)
+        if start >= self.published_points:
+            return
+        for arrays in (self.active_positioners_arrays, self.active_detectors_arrays, self.timing_arrays):
+            for key in arrays:
+                arrays[key] = arrays[key].copy()
+        self.virtual_channels.rewind(start)
+        self.published_points = 0
+
+    def publish_snapshot(self):
+        """Publish the first num_points of every active array as read-only views.
+
+        New points are written past num_points, scans start in new buffers and
+        detach_buffers copies them before a published point is rewritten, so a
+        published view never changes.
+        """
+        positioners = {}
+        for key, array in self.active_positioners_arrays.items():
+            positioners[key] = array[:self.num_points]
+            positioners[key].flags.writeable = False
+        detectors = {}
+        for key, array in self.active_detectors_arrays.items():
+            detectors[key] = array[:self.num_points]
+            detectors[key].flags.writeable = False
+        # virtual channels only evaluate the points added since the last snapshot
+        self.virtual_channels.update(dict(self.active_positioners_arrays, **self.active_detectors_arrays),
+                                     self.num_points)
+        for key, array in self.virtual_channels.arrays(self.num_points).items():
+            detectors[key] = array
+            detectors[key].flags.writeable = False
+        timing = {}
+        for key, array in self.timing_arrays.items():
+            timing[key] = array[:self.num_points]
+            timing[key].flags.writeable = False
+        self.published_points = self.num_points
+        first_changed = min(self.first_changed, self.num_points)
+        self.first_changed = self.num_points
+        self.snapshot_version += 1
+        self.latest_snapshot = ScanSnapshot(
+            version=self.snapshot_version,
+            num_points=self.num_points,
+            scanning=self.data.value == 0,
+            positioners_arrays=positioners,
+            positioners_names=dict(self.active_positioners_names),
+            detectors_arrays=detectors,
+            detectors_names=dict(self.active_detectors_names, **self.virtual_channels.names()),
+            timing_arrays=timing,
+            first_changed=first_changed)
+        self.snapshot_ready(self.latest_snapshot)
+
+    def update_active_positioner(self, pvname):
+        # changes are collected and resolved together once the burst is over
+        self.pending_positioners.add(int(pvname[-3]))
+        self.schedule_resolve()
+
+    def update_active_detector(self, pvname):
+        self.pending_detectors.add(pvname[-4:-2])
+        self.schedule_resolve()
+
+    @staticmethod
+    def positioner_name_field(pv_value, record_type):
+        # field holding a readable name for the positioner, if any
+        if record_type == 'motor':
+            return pv_value.rsplit('.')[0] + '.DESC'
+        return None
+
+    @staticmethod
+    def detector_name_field(pv_value, record_type):
+        # field holding a readable name for the detector, or a fixed description
+        new_trunk = pv_value.rsplit('.')[0]
+        new_branch = '.' + pv_value.rsplit('.')[1]
+        if record_type == 'scaler':
+            if '.S' in new_branch:
+                return new_trunk + new_branch.replace('S', 'NM')
+            elif '.T' in new_branch:
+                return ' (Elapsed Time)'
+        elif record_type == 'transform':
+            return new_trunk + new_branch[:1] + 'CMT' + new_branch[1:]
+        elif record_type == 'mca':
+            return new_trunk + new_branch + 'NM'
+        return None
+
+    def resolve_pending(self):
+        """Resolve validity and names of every changed positioner and detector.
+
+        The whole burst costs two batched round-trips: validity plus record types,
+        then the name fields, instead of several sequential cagets per channel.
+        """
+        positioners = sorted(self.pending_positioners)
+        detectors = sorted(self.pending_detectors)
+        self.pending_positioners = set()
+        self.pending_detectors = set()
+        self.pending_since = None
+        self.resolve_deadline = None
+        if not positioners and not detectors:
+            return
+
+        # round-trip 1: validity of each changed channel and type of each target record
+        pv_values = {}
+        for n in positioners:
+            pv_values[f'P{n}PV'] = self.pnpv[f'P{n}PV'].value
+        for nn in detectors:
+            pv_values[f'D{nn}PV'] = self.dnnpv[f'D{nn}PV'].value
+        record_trunks = sorted({value.rsplit('.')[0] for value in pv_values.values() if '.' in value})
+        nv_names = [self.trunk + key.replace('PV', 'NV') for key in pv_values]
+        results = self.fetch_many(nv_names + [trunk + '.RTYP' for trunk in record_trunks])
+        validity = dict(zip(pv_values, results[:len(nv_names)]))
+        record_types = dict(zip(record_trunks, results[len(nv_names):]))
+
+        # round-trip 2: the name field of every valid channel and the native type of each valid detector
+        name_fields = {}
+        for key, value in pv_values.items():
+            if validity[key] != 0 or '.' not in value:
+                continue
+            record_type = record_types.get(value.rsplit('.')[0])
+            if key.startswith('P'):
+                name_fields[key] = self.positioner_name_field(value, record_type)
+            else:
+                name_fields[key] = self.detector_name_field(value, record_type)
+        lookups = [key for key in name_fields if name_fields[key] and not name_fields[key].startswith(' ')]
+        typed = [key for key in pv_values if key.startswith('D') and validity[key] == 0 and pv_values[key]]
+        dtypes = dict(zip(typed, self.fetch_dtypes([pv_values[key] for key in typed])))
+        descriptions = dict(zip(lookups, self.fetch_many([name_fields[key] for key in lookups]) if lookups else []))
+
+        for key, value in pv_values.items():
+            if validity[key] is None:
+                # no answer from the IOC; leave the channel as it was
+                continue
+            if key.startswith('P'):
+                arrays, names, key_cv = self.active_positioners_arrays, self.active_positioners_names, f'R{key[1]}CV'
+            else:
+                arrays, names, key_cv = self.active_detectors_arrays, self.active_detectors_names, key[:3] + 'CV'
+            if validity[key] == 0:
+                dtype = dtypes.get(key, np.float64)
+                if key_cv not in arrays or arrays[key_cv].dtype != dtype:
+                    arrays[key_cv] = np.zeros(constants.MAX_NUM_POINTS, dtype)
+                    self.first_changed = 0
+                if key.startswith('D'):
+                    self.channel_dtypes[key_cv] = dtype
+                if key in descriptions:
+                    name = f' ({descriptions[key]})' if descriptions[key] else ''
+                elif name_fields.get(key):
+                    name = name_fields[key]
+                else:
+                    name = ''
+                names[key] = value + name
+            elif key_cv in arrays:
+                del arrays[key_cv]
+                del names[key]
+        if positioners:
+            self.positioners_modified_flag = True
+        if detectors:
+            self.detectors_modified_flag = True
+        self.publish_snapshot()
+
+    def initialize_active_positioners(self):
+        for n in range(1, constants.NUM_POSITIONERS + 1):
+            self.pending_positioners.add(n)
+
+    def initialize_active_detectors(self):
+        for i in range(1, constants.NUM_DETECTORS + 1):
+            self.pending_detectors.add('%2.2i' % i)
+
@@ -0,0 +1,107 @@
+import os
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+'''
+Background export of finished scans
+
+Exports run on a single writer thread so files are written in scan order and
+the GUI is free for the next scan at once.  The writer reads the snapshot's
+read-only arrays directly; CSV rows are formatted in blocks so memory stays
+bounded for very large scans.  HDF5 needs h5py, which is optional.
+'''
+
+CSV_BLOCK_ROWS = 10000
+
+
+def export_columns(snapshot, derivative_of=None):
+    """Return (keys, names, arrays) for every channel in a snapshot.
+
+    derivative_of names the positioner key used as x for d/dx columns, if any.
+    """
+    keys, names, arrays = [], [], []
+    for key, values in snapshot.positioners_arrays.items():
+        keys.append(key)
+        names.append(snapshot.positioners_names.get(key.replace('R', 'P').replace('CV', 'PV'), key))
+        arrays.append(values)
+    for key, values in snapshot.detectors_arrays.items():
+        keys.append(key)
+        names.append(snapshot.detectors_names.get(key.replace('CV', 'PV'), key))
+        arrays.append(values)
+    if derivative_of in snapshot.positioners_arrays and snapshot.num_points > 1:
+        x_values = snapshot.positioners_arrays[derivative_of]
+        for key, values in snapshot.detectors_arrays.items():
+            keys.append(f'd{key}/d{derivative_of}')
+            names.append('derivative of ' + snapshot.detectors_names.get(key.replace('CV', 'PV'), key))
+            # computed here on the writer thread, not on the GUI thread
+            with np.errstate(all='ignore'):
+                arrays.append(np.gradient(values.astype(np.float64), x_values))
+    return keys, names, arrays
+
+
+def write_csv(path, keys, names, arrays, num_points):
+    with open(path, 'w') as f:
+        f.write('# ' + ','.join(names) + '\n')
+        f.write(','.join(keys) + '\n')
+        for start in range(0, num_points, CSV_BLOCK_ROWS):
+            stop = min(start + CSV_BLOCK_ROWS, num_points)
+            block = np.column_stack([values[start:stop] for values in arrays])
+            np.savetxt(f, block, delimiter=',', fmt='%.10g')
+
+
+def write_hdf5(path, keys, names, arrays, num_points):
+    import h5py
+    with h5py.File(path, 'w') as f:
+        f.attrs['num_points'] = num_points
+        for key, name, values in zip(keys, names, arrays):
+            dataset = f.create_dataset(key.replace('/', '_'), data=values)
+            dataset.attrs['name'] = name
+
+
+def unique_path(directory, stem, extension):
+    # a repeated stem (e.g. a rescan into the same file name) gets _1, _2 ... instead of overwriting
+    path = os.path.join(directory, f'{stem}.{extension}')
+    n = 0
+    while os.path.exists(path):
+        n += 1
+        path = os.path.join(directory, f'{stem}_{n}.{extension}')
+    return path
+
+
+class ScanExporter:
+    def __init__(self):
+        self.pool = ThreadPoolExecutor(max_workers=1)
+
+    def export(self, snapshot, directory, stem, fmt, derivative_of=None):
+        if snapshot.num_points == 0:
+            return
+        self.pool.submit(self.write, snapshot, directory, stem, fmt, derivative_of)
+
+    def write(self, snapshot, directory, stem, fmt, derivative_of):
+        if fmt == 'hdf5':
+            try:
+                import h5py
+            except ImportError:
+                print('h5py is not installed, exporting as csv')
+                fmt = 'csv'
+        path = None
+        try:
+            os.makedirs(directory, exist_ok=True)
+            # only this one writer thread creates export files, so the name cannot be taken meanwhile
+            path = unique_path(directory, stem, 'h5' if fmt == 'hdf5' else 'csv')
+            keys, names, arrays = export_columns(snapshot, derivative_of)
+            if fmt == 'hdf5':
+                write_hdf5(path, keys, names, arrays, snapshot.num_points)
+            else:
+                write_csv(path, keys, names, arrays, snapshot.num_points)
+            print('exported', path)
+        except Exception as error:
+            # the future is never looked at, so anything not reported here would vanish
+            print(f'export of {stem} failed: {error!r}')
+            # a half-written file would look like a good export
+            if path is not None and os.path.exists(path):
+                os.remove(path)
+
+    def shutdown(self):
+        # let a running export finish so no file is left half written
+        self.pool.shutdown(wait=True)
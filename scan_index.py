@@ -0,0 +1,239 @@
+import os
+import sys
+import glob
+import sqlite3
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from kernels import crossings
+
+'''
+Statistics index of archived MDA scans
+
+Every 1D scan file is parsed once and, for each detector, peak, position of
+the peak, centroid, FWHM, integral and min/max are stored in an SQLite
+table indexed by detector and statistic.  update() re-parses only files
+that are new or changed since the last pass (in parallel worker processes
+when there are many), so it is cheap to run after every scan.  query()
+answers range queries such as
+
+    D05 peak>=1e5 x_peak=12.2:12.4
+
+newest scan first, from the indexes rather than the files.
+'''
+
+INDEX_FILE = os.path.join(os.path.expanduser('~'), '.oculus3', 'scan_index.sqlite')
+STATISTICS = ('peak', 'x_peak', 'centroid', 'fwhm', 'integral', 'minimum', 'maximum')
+INDEXED_STATISTICS = ('peak', 'x_peak', 'centroid', 'fwhm', 'integral')
+# below this many changed files, parsing in-process beats starting workers
+MIN_PARALLEL_FILES = 8
+
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, '
+    'num_points INTEGER, positioner TEXT)',
+    'CREATE TABLE IF NOT EXISTS stats (path TEXT, detector TEXT, name TEXT, mtime_ns INTEGER, '
+    + ', '.join(f'{statistic} REAL' for statistic in STATISTICS) + ')',
+    'CREATE INDEX IF NOT EXISTS stats_path ON stats (path)',
+] + [f'CREATE INDEX IF NOT EXISTS stats_{statistic} ON stats (detector, {statistic})'
+     for statistic in INDEXED_STATISTICS]
+
+
+def scan_statistics(x_values, y_values):
+    """Return the STATISTICS of one detector curve as a tuple (NaN where undefined)."""
+    finite = np.isfinite(x_values) & np.isfinite(y_values)
+    x_values, y_values = x_values[finite], y_values[finite]
+    if y_values.size == 0:
+        return (np.nan,) * len(STATISTICS)
+    i_peak = int(np.argmax(y_values))
+    minimum, peak = float(y_values.min()), float(y_values[i_peak])
+    x_peak = float(x_values[i_peak])
+    # centroid and width are taken above the lowest point, so a flat background does not dominate
+    weights = y_values - minimum
+    total = weights.sum()
+    centroid = float((x_values * weights).sum() / total) if total > 0 else np.nan
+    half = minimum + (peak - minimum) / 2.0
+    left = crossings(x_values[:i_peak + 1], y_values[:i_peak + 1], half)
+    right = crossings(x_values[i_peak:], y_values[i_peak:], half)
+    fwhm = float(abs(right[0] - left[-1])) if left.size and right.size else np.nan
+    integral = float(((y_values[1:] + y_values[:-1]) * np.diff(x_values)).sum() / 2.0)
+    return peak, x_peak, centroid, fwhm, integral, minimum, peak
+
+
+def index_file(path):
+    """Parse one MDA file; return (path, mtime_ns, size, num_points, positioner, rows).
+
+    Runs in a worker process.  A file that cannot be read is returned with
+    num_points -1, so it is skipped until it changes.
+    """
+    # imported here so spawned workers do not pull in anything else
+    from mda_cache import ArchivedScan, parse_mda
+    stat = os.stat(path)
+    try:
+        keys, names, num_points, table = parse_mda(path)
+    except ImportError:
+        # no reader at all is not a property of the file
+        raise
+    except Exception as error:
+        print(f'could not index {path}: {error}')
+        return path, stat.st_mtime_ns, stat.st_size, -1, '', []
+    scan = ArchivedScan(path, keys, names, num_points, table)
+    x_values = scan.positioner(1)
+    positioner = next((names[key] for key in keys if key.startswith('R')), '')
+    rows = []
+    for key in keys:
+        if key.startswith('D'):
+            rows.append((key[:3], names[key]) + scan_statistics(x_values, scan.arrays[key]))
+    return path, stat.st_mtime_ns, stat.st_size, num_points, positioner, rows
+
+
+def parse_query(text):
+    """Turn 'D05 peak>=1e5 x_peak=12.2:12.4' into (detector, name, {statistic: (low, high)})."""
+    detector, name, ranges = None, None, {}
+    for term in text.split():
+        for operator in ('>=', '<=', '>', '<', '='):
+            if operator in term:
+                statistic, value = term.split(operator, 1)
+                break
+        else:
+            # a bare term is a detector key (D05) or part of a detector name
+            if len(term) == 3 and term[0] in 'Dd' and term[1:].isdigit():
+                detector = term.upper()
+            else:
+                name = term
+            continue
+        if statistic not in STATISTICS:
+            raise ValueError(f'unknown statistic {statistic!r}, use one of {", ".join(STATISTICS)}')
+        low, high = ranges.get(statistic, (None, None))
+        if operator == '=':
+            # low:high, either end may be left open; a single value is an exact match
+            low_text, colon, high_text = value.partition(':')
+            if not colon:
+                high_text = low_text
+            low = float(low_text) if low_text else None
+            high = float(high_text) if high_text else None
+        elif operator[0] == '>':
+            low = float(value)
+        else:
+            high = float(value)
+        ranges[statistic] = (low, high)
+    return detector, name, ranges
+
+
+class ScanIndex:
+    def __init__(self, path=INDEX_FILE):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self.connect() as connection:
+            # WAL lets queries run while an update is writing
+            connection.execute('PRAGMA journal_mode=WAL')
+            for statement in SCHEMA:
+                connection.execute(statement)
+
+    def connect(self):
+        # one connection per call, so the index can be used from any thread
+        return sqlite3.connect(self.path, timeout=30)
+
+    def update(self, directory, workers=None):
+        """Index new and changed MDA files under directory; return the number indexed."""
+        directory = os.path.abspath(directory)
+        paths = glob.glob(os.path.join(directory, '**', '*.mda'), recursive=True)
+        # exact prefix match: LIKE would treat '_' as a wildcard and ignore case, so a sibling
+        # directory such as run_1 vs runX1 or RUN_1 would lose its rows as "removed"
+        prefix = directory + os.sep
+        with self.connect() as connection:
+            known = {row[0]: row[1:] for row in connection.execute(
+                'SELECT path, mtime_ns, size FROM files WHERE substr(path, 1, ?) = ?', (len(prefix), prefix))}
+        changed = []
+        for path in paths:
+            stat = os.stat(path)
+            if known.pop(path, None) != (stat.st_mtime_ns, stat.st_size):
+                changed.append(path)
+        if len(changed) < MIN_PARALLEL_FILES:
+            results = map(index_file, changed)
+            self.store(results, removed=list(known))
+        else:
+            # spawned, not forked: the caller may be a threaded Qt application
+            with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+                self.store(pool.map(index_file, changed, chunksize=16), removed=list(known))
+        return len(changed)
+
+    def store(self, results, removed=()):
+        # NaN statistics are stored as NULL, explicitly rather than by driver accident: a NULL
+        # never satisfies a range clause, so an undefined fwhm cannot match 'fwhm<=0.1'
+        with self.connect() as connection:
+            for path in removed:
+                connection.execute('DELETE FROM files WHERE path = ?', (path,))
+                connection.execute('DELETE FROM stats WHERE path = ?', (path,))
+            for path, mtime_ns, size, num_points, positioner, rows in results:
+                connection.execute('DELETE FROM stats WHERE path = ?', (path,))
+                connection.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)',
+                                   (path, mtime_ns, size, num_points, positioner))
+                connection.executemany(f'INSERT INTO stats VALUES ({", ".join("?" * (4 + len(STATISTICS)))})',
+                                       [(path, row[0], row[1], mtime_ns) + tuple(None if np.isnan(value) else value
+                                                                                  for value in row[2:])
+                                        for row in rows])
+
+    def query(self, detector=None, name=None, ranges=None, limit=50):
+        """Return matching rows as dicts, newest scan first."""
+        clauses, parameters = [], []
+        if detector:
+            clauses.append('detector = ?')
+            parameters.append(detector)
+        if name:
+            clauses.append('name LIKE ?')
+            parameters.append(f'%{name}%')
+        for statistic, (low, high) in (ranges or {}).items():
+            if statistic not in STATISTICS:
+                raise ValueError(f'unknown statistic {statistic!r}')
+            if low is not None:
+                clauses.append(f'{statistic} >= ?')
+                parameters.append(low)
+            if high is not None:
+                clauses.append(f'{statistic} <= ?')
+                parameters.append(high)
+        where = ' WHERE ' + ' AND '.join(clauses) if clauses else ''
+        columns = ('path', 'detector', 'name') + STATISTICS
+        with self.connect() as connection:
+            rows = connection.execute(f'SELECT {", ".join(columns)} FROM stats{where} '
+                                      f'ORDER BY mtime_ns DESC LIMIT ?', parameters + [limit]).fetchall()
+        return [dict(zip(columns, row)) for row in rows]
+
+
+def format_statistic(value, spec):
+    # undefined statistics come back from SQLite as NULL (None)
+    return 'n/a' if value is None else format(value, spec)
+
+
+def describe(row):
+    return (f'{os.path.basename(row["path"])}  {row["detector"]}'
+            f'  peak {format_statistic(row["peak"], ".4g")} at {format_statistic(row["x_peak"], ".5g")}'
+            f'  centroid {format_statistic(row["centroid"], ".5g")}  fwhm {format_statistic(row["fwhm"], ".3g")}'
+            f'  integral {format_statistic(row["integral"], ".4g")}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Index archived MDA scans by statistics and search them.')
+    parser.add_argument('--index', default=INDEX_FILE)
+    commands = parser.add_subparsers(dest='command', required=True)
+    update = commands.add_parser('update', help='index new and changed files under directories')
+    update.add_argument('directories', nargs='+')
+    update.add_argument('--workers', type=int, default=None)
+    query = commands.add_parser('query', help="search, e.g. 'D05 peak>=1e5 x_peak=12.2:12.4'")
+    query.add_argument('terms', nargs='+')
+    query.add_argument('--limit', type=int, default=50)
+    args = parser.parse_args(argv)
+
+    index = ScanIndex(args.index)
+    if args.command == 'update':
+        for directory in args.directories:
+            print(f'{directory}: {index.update(directory, args.workers)} files indexed')
+        return 0
+    detector, name, ranges = parse_query(' '.join(args.terms))
+    for row in index.query(detector, name, ranges, args.limit):
+        print(describe(row))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
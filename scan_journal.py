@@ -0,0 +1,99 @@
+import os
+import json
+import time
+import numpy as np
+
+'''
+Crash-safe journal of the live scan
+
+One journal file per scan record holds a fixed 4 kB header followed by a
+float64 table with one row per scan point and one column per active channel.
+Both are memory-mapped, so appending a point is a row store plus a counter
+store; the kernel writes the pages back even if Oculus itself dies.
+
+Header layout:
+    0   8 bytes   magic
+    8   int64     number of points written
+    16  int64     capacity (rows)
+    24  int64     state (RUNNING or FINISHED)
+    32  int64     length of the JSON channel layout
+    40  JSON      trunk, scan file name, channel keys, start time
+'''
+
+JOURNAL_DIR = os.path.join(os.path.expanduser('~'), '.oculus3', 'journal')
+MAGIC = b'OCJRNL01'
+HEADER_SIZE = 4096
+RUNNING = 1
+FINISHED = 2
+
+
+def journal_path(trunk, journal_dir=JOURNAL_DIR):
+    # one journal per scan record, e.g. '16test_scan1.journal'
+    name = trunk.replace(':', '_').rstrip('.') + '.journal'
+    return os.path.join(journal_dir, name)
+
+
+class ScanJournal:
+    def __init__(self, path, layout, counters, table):
+        self.path = path
+        self.layout = layout
+        self.keys = layout['channels']
+        self.counters = counters
+        self.table = table
+
+    @classmethod
+    def create(cls, path, trunk, scan_file, keys, capacity):
+        layout = {'trunk': trunk, 'scan_file': scan_file, 'channels': list(keys), 'started': time.time()}
+        text = json.dumps(layout).encode()
+        if len(text) > HEADER_SIZE - 40:
+            raise ValueError('journal channel layout does not fit in the header')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        header = bytearray(HEADER_SIZE)
+        header[:8] = MAGIC
+        header[8:40] = np.array([0, capacity, RUNNING, len(text)], dtype=np.int64).tobytes()
+        header[40:40 + len(text)] = text
+        with open(path, 'wb') as f:
+            f.write(header)
+            # size the file up front so appends never grow it
+            f.truncate(HEADER_SIZE + capacity * max(len(keys), 1) * 8)
+        return cls.open(path)
+
+    @classmethod
+    def open(cls, path):
+        with open(path, 'rb') as f:
+            header = f.read(HEADER_SIZE)
+        if len(header) < HEADER_SIZE or header[:8] != MAGIC:
+            raise ValueError(f'{path} is not an Oculus scan journal')
+        num_points, capacity, state, length = np.frombuffer(header[8:40], dtype=np.int64)
+        layout = json.loads(header[40:40 + length].decode())
+        counters = np.memmap(path, dtype=np.int64, mode='r+', offset=8, shape=(3,))
+        table = np.memmap(path, dtype=np.float64, mode='r+', offset=HEADER_SIZE,
+                          shape=(capacity, max(len(layout['channels']), 1)))
+        return cls(path, layout, counters, table)
+
+    @property
+    def num_points(self):
+        return int(self.counters[0])
+
+    @property
+    def running(self):
+        return self.counters[2] == RUNNING
+
+    def append(self, index, values):
+        # the row goes in before the counter, so a reader never sees a partial point
+        if index >= self.table.shape[0]:
+            return
+        self.table[index, :len(values)] = values
+        if index + 1 > self.counters[0]:
+            self.counters[0] = index + 1
+
+    def channel(self, key):
+        return np.array(self.table[:self.num_points, self.keys.index(key)])
+
+    def finish(self):
+        self.counters[2] = FINISHED
+        self.close()
+
+    def close(self):
+        self.table.flush()
+        self.counters.flush()
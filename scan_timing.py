@@ -0,0 +1,53 @@
+import numpy as np
+
+'''
+Per-point scan timing
+
+For every point the acquisition thread keeps three CA timestamps:
+    TSPOS  latest timestamp of the active positioner readbacks (RnCV)
+    TSDET  latest timestamp of the active detector values (DnnCV)
+    TSVAL  timestamp of the VAL update that announced the point
+From these:
+    dwell      TSDET[i] - TSPOS[i]       settling plus detector readout
+    dead time  TSPOS[i] - TSDET[i - 1]   move and record processing between points
+    rate       1 / (TSVAL[i] - TSVAL[i - 1])
+'''
+
+TIMING_KEYS = ('TSPOS', 'TSDET', 'TSVAL')
+ETA_WINDOW = 10
+
+
+def timing_series(timing_arrays):
+    """Return dwell, dead time and point rate arrays (NaN where undefined)."""
+    t_pos = timing_arrays['TSPOS']
+    t_det = timing_arrays['TSDET']
+    t_val = timing_arrays['TSVAL']
+    dwell = t_det - t_pos
+    dead = np.full(t_pos.size, np.nan)
+    rate = np.full(t_pos.size, np.nan)
+    if t_pos.size > 1:
+        dead[1:] = t_pos[1:] - t_det[:-1]
+        with np.errstate(divide='ignore'):
+            rate[1:] = 1.0 / np.diff(t_val)
+    return dwell, dead, rate
+
+
+def eta_seconds(timing_arrays, num_points, total_points):
+    # median of the most recent point periods, so one slow point does not swing the estimate
+    t_val = timing_arrays['TSVAL'][max(num_points - ETA_WINDOW - 1, 0):num_points]
+    if t_val.size < 2 or total_points <= num_points:
+        return None
+    # backfilled and reattached points have no TSVAL, so their periods are skipped
+    periods = np.diff(t_val)
+    periods = periods[np.isfinite(periods)]
+    if periods.size == 0:
+        return None
+    return float(np.nanmedian(periods)) * (total_points - num_points)
+
+
+def format_eta(seconds):
+    if seconds is None or not np.isfinite(seconds):
+        return '--:--'
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f'{hours}:{minutes:02d}:{seconds:02d}' if hours else f'{minutes:02d}:{seconds:02d}'
@@ -0,0 +1,65 @@
+import numpy as np
+from PyQt5 import QtCore as qtc
+from PyQt5 import QtGui as qtg
+
+'''
+Small live previews of each detector for the detector list
+
+Each preview is a QPixmap drawn with one QPainter polyline from at most
+two points per pixel column, so the cost does not depend on scan length.
+A pixmap is only redrawn when its channel has new points.
+'''
+
+SPARKLINE_WIDTH = 60
+SPARKLINE_HEIGHT = 14
+SPARKLINE_INTERVAL = 500
+
+
+def decimate(y_values, width):
+    # keep the min and max of each pixel column so spikes survive
+    if y_values.size <= 2 * width:
+        return np.asarray(y_values, dtype=float)
+    y_values = np.asarray(y_values, dtype=float)
+    # uneven bins spread the remainder over the columns, so no point (least of all the newest) is lost
+    starts = np.arange(width) * y_values.size // width
+    decimated = np.empty(2 * width)
+    decimated[0::2] = np.minimum.reduceat(y_values, starts)
+    decimated[1::2] = np.maximum.reduceat(y_values, starts)
+    return decimated
+
+
+class SparklineCache:
+    def __init__(self, width=SPARKLINE_WIDTH, height=SPARKLINE_HEIGHT):
+        self.width = width
+        self.height = height
+        # one transparent pixmap shared by every row without enough data
+        self.blank = qtg.QPixmap(width, height)
+        self.blank.fill(qtc.Qt.transparent)
+        # key -> (number of points drawn, pixmap)
+        self.drawn = {}
+
+    def clear(self):
+        self.drawn = {}
+
+    def pixmap(self, key, y_values, color):
+        """Return (pixmap, changed) for the current data of one channel."""
+        num_points = len(y_values)
+        if key in self.drawn and self.drawn[key][0] == num_points:
+            return self.drawn[key][1], False
+        if num_points < 2:
+            self.drawn[key] = (num_points, self.blank)
+            return self.blank, True
+        y = decimate(y_values, self.width)
+        y_min, y_max = np.nanmin(y), np.nanmax(y)
+        span = y_max - y_min if y_max > y_min else 1.0
+        xs = np.linspace(0, self.width - 1, y.size)
+        ys = (self.height - 2) * (1.0 - (y - y_min) / span) + 1
+        polygon = qtg.QPolygonF([qtc.QPointF(x, y) for x, y in zip(xs, np.nan_to_num(ys))])
+        pixmap = qtg.QPixmap(self.width, self.height)
+        pixmap.fill(qtc.Qt.transparent)
+        painter = qtg.QPainter(pixmap)
+        painter.setPen(qtg.QPen(qtg.QColor(*color), 1))
+        painter.drawPolyline(polygon)
+        painter.end()
+        self.drawn[key] = (num_points, pixmap)
+        return pixmap, True
@@ -0,0 +1,74 @@
+import numpy as np
+
+'''
+Rolling spectra of detector time series
+
+Each selected DnnCV channel is sampled at its monitor rate into a
+SampleRing.  Every hop (a quarter window of new samples) the last `window`
+samples of each channel are resampled onto an even time grid (monitor
+updates are not evenly spaced), tapered with a Hann window and transformed
+together with one rfft over a channels x window block.  The cost per update
+is set by the window size alone, however long the channel has been
+recorded.  Each spectrum also becomes one row of a fixed-size spectrogram.
+'''
+
+SPECTRUM_WINDOW = 1024
+SPECTROGRAM_ROWS = 200
+SPECTRUM_INTERVAL = 250
+
+
+class SpectrumAnalyzer:
+    def __init__(self, window=SPECTRUM_WINDOW, rows=SPECTROGRAM_ROWS):
+        self.window = window
+        self.hop = max(window // 4, 1)
+        self.taper = np.hanning(window)
+        # scales |rfft|^2 of the tapered window to a one-sided power spectral density
+        self.taper_power = (self.taper ** 2).sum()
+        self.rows = rows
+        self.last_count = {}
+        self.spectrograms = {}
+        self.frequencies = {}
+
+    def reset(self):
+        self.last_count = {}
+        self.spectrograms = {}
+        self.frequencies = {}
+
+    def update(self, rings):
+        """Return {key: (frequencies, psd)} for every ring with a hop of new samples."""
+        keys, blocks, steps = [], [], []
+        for key, ring in rings.items():
+            # a channel watched again starts a new ring, counting from zero
+            last_count = self.last_count.get(key, 0) if self.last_count.get(key, 0) <= ring.count else 0
+            if ring.count - last_count < self.hop or len(ring) < self.window:
+                continue
+            times, values = ring.latest(self.window)
+            step = (times[-1] - times[0]) / (self.window - 1)
+            if not step > 0:
+                continue
+            grid = times[0] + step * np.arange(self.window)
+            uniform = np.interp(grid, times, values)
+            keys.append(key)
+            blocks.append(uniform - uniform.mean())
+            steps.append(step)
+            self.last_count[key] = ring.count
+        if not keys:
+            return {}
+        block = np.vstack(blocks) * self.taper
+        power = np.abs(np.fft.rfft(block, axis=1)) ** 2
+        results = {}
+        for row, key in enumerate(keys):
+            psd = power[row] * (2.0 * steps[row] / self.taper_power)
+            frequencies = np.fft.rfftfreq(self.window, steps[row])
+            self.add_spectrogram_row(key, psd, frequencies)
+            results[key] = (frequencies, psd)
+        return results
+
+    def add_spectrogram_row(self, key, psd, frequencies):
+        # the newest row goes last; the oldest rolls out once rows are full
+        if key not in self.spectrograms:
+            self.spectrograms[key] = np.full((self.rows, psd.size), np.nan)
+        image = self.spectrograms[key]
+        image[:-1] = image[1:]
+        image[-1] = np.log10(psd + np.finfo(float).tiny)
+        self.frequencies[key] = frequencies
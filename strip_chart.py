@@ -0,0 +1,36 @@
+import numpy as np
+
+'''
+Strip chart of detector monitors between scans
+
+The checked detectors are recorded at their full monitor rate into
+ChannelMonitor rings of STRIP_CHART_CAPACITY samples (about seven hours at
+10 Hz).  The rings are drawn reduced to at most two points per pixel
+column, the min and max of each column in time order.  Spikes stay visible,
+and redraw cost is set by the plot width, not the history length.
+'''
+
+STRIP_CHART_CAPACITY = 2 ** 18
+STRIP_CHART_INTERVAL = 500
+
+
+def decimate_series(times, values, width):
+    """Reduce a time series to at most 2 * width points, keeping each bin's min and max."""
+    width = max(int(width), 1)
+    if values.size <= 2 * width:
+        return times, values
+    per_bin = values.size // width
+    # the oldest remainder is dropped so the newest samples are always drawn
+    start = values.size - per_bin * width
+    v = values[start:].reshape(width, per_bin)
+    t = times[start:].reshape(width, per_bin)
+    i_min = np.argmin(v, axis=1)
+    i_max = np.argmax(v, axis=1)
+    # within a bin the two points keep their time order
+    first, second = np.minimum(i_min, i_max), np.maximum(i_min, i_max)
+    rows = np.arange(width)
+    decimated_t = np.empty(2 * width)
+    decimated_v = np.empty(2 * width)
+    decimated_t[0::2], decimated_t[1::2] = t[rows, first], t[rows, second]
+    decimated_v[0::2], decimated_v[1::2] = v[rows, first], v[rows, second]
+    return decimated_t, decimated_v
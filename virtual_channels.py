@@ -0,0 +1,108 @@
+import ast
+import numpy as np
+import constants
+
+'''
+Virtual ("math") detector channels
+
+Expressions such as 'D03/D01', 'D04+D05+D06' or 'log(D02/D01)' are parsed
+and compiled once.  Each channel keeps its own buffer and only evaluates the
+points added since the last update, vectorized over that slice.
+'''
+
+FUNCTIONS = {'log': np.log, 'log10': np.log10, 'exp': np.exp, 'sqrt': np.sqrt, 'abs': np.abs}
+ALLOWED_NODES = (ast.Expression, ast.BinOp, ast.UnaryOp, ast.Name, ast.Load, ast.Constant, ast.Call,
+                 ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Pow, ast.USub, ast.UAdd)
+
+
+def compile_expression(text):
+    """Return (code, channel keys) for text; raise ValueError if it is not allowed."""
+    try:
+        tree = ast.parse(text, mode='eval')
+    except SyntaxError:
+        raise ValueError(f'cannot parse {text!r}')
+    keys = set()
+    for node in ast.walk(tree):
+        if not isinstance(node, ALLOWED_NODES):
+            raise ValueError(f'{type(node).__name__} is not allowed in {text!r}')
+        if isinstance(node, ast.Call) and not (isinstance(node.func, ast.Name) and node.func.id in FUNCTIONS):
+            raise ValueError(f'only {", ".join(FUNCTIONS)} may be called')
+        if isinstance(node, ast.Name) and node.id not in FUNCTIONS:
+            # D03 -> D03CV, R1 -> R1CV
+            if not (node.id[0] in 'DR' and node.id[1:].isdigit()):
+                raise ValueError(f'unknown channel {node.id!r}')
+            keys.add(node.id + 'CV')
+    return compile(tree, '<virtual channel>', 'eval'), sorted(keys)
+
+
+class VirtualChannel:
+    def __init__(self, expression):
+        self.expression = expression
+        self.code, self.keys = compile_expression(expression)
+        self.buffer = np.zeros(constants.MAX_NUM_POINTS)
+        self.computed = 0
+
+    def reset(self):
+        # a fresh buffer keeps previously published snapshots intact
+        self.buffer = np.zeros(constants.MAX_NUM_POINTS)
+        self.computed = 0
+
+    def rewind(self, start):
+        # points from start on are recomputed, into a copy the published snapshots do not share
+        if start < self.computed:
+            self.buffer = self.buffer.copy()
+            self.computed = start
+
+    def update(self, arrays, num_points):
+        if num_points < self.computed:
+            self.reset()
+        start = self.computed
+        if num_points == start:
+            return
+        namespace = dict(FUNCTIONS)
+        for key in self.keys:
+            if key not in arrays:
+                self.buffer[start:num_points] = np.nan
+                self.computed = num_points
+                return
+            # compact integer buffers are widened so sums and ratios neither overflow nor truncate
+            namespace[key[:-2]] = arrays[key][start:num_points].astype(np.float64)
+        with np.errstate(all='ignore'):
+            self.buffer[start:num_points] = eval(self.code, {'__builtins__': {}}, namespace)
+        self.computed = num_points
+
+
+class VirtualChannels:
+    def __init__(self):
+        self.channels = {}
+
+    def add(self, expression):
+        # raises ValueError for a bad expression, returns the new key (e.g. 'V01CV')
+        channel = VirtualChannel(expression)
+        for i in range(1, constants.NUM_VIRTUAL_DETECTORS + 1):
+            key = 'V%2.2iCV' % i
+            if key not in self.channels:
+                self.channels[key] = channel
+                return key
+        raise ValueError('no free virtual channel')
+
+    def clear(self):
+        self.channels = {}
+
+    def reset(self):
+        for key in self.channels:
+            self.channels[key].reset()
+
+    def rewind(self, start):
+        for key in self.channels:
+            self.channels[key].rewind(start)
+
+    def update(self, arrays, num_points):
+        for key in self.channels:
+            self.channels[key].update(arrays, num_points)
+
+    def arrays(self, num_points):
+        return {key: self.channels[key].buffer[:num_points] for key in self.channels}
+
+    def names(self):
+        return {key.replace('CV', 'PV'): self.channels[key].expression for key in self.channels}